@@ -0,0 +1,131 @@
+import bundle
+bundle.install()
+import profiling
+
+if __name__ == "__main__":
+    profiling.start(__file__)
+
+import http_client
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+import bookmark_store
+import result_cache
+from config import HORADER_API_URL, HEADERS
+
+# Bookmark field set by each toggle action
+TOGGLE_FIELDS = {
+    "archive": "archived",
+    "favorite": "favourited"
+}
+ACTION_WORKERS = 4
+
+def parse_action(text):
+    """
+    Split "action:id[:state]" into (action, id, state).
+
+    The state is the value the caller wants the field to have ("true"/"false").
+    link-info.py knows the current state, so it passes it and no GET is needed.
+    """
+    parts = text.strip().split(":")
+    if len(parts) < 2 or not parts[1]:
+        return None
+    state = None
+    if len(parts) > 2 and parts[2] in ("true", "false"):
+        state = parts[2] == "true"
+    return parts[0], parts[1], state
+
+def current_state(bookmark_id, field):
+    bookmark = bookmark_store.get_bookmark(bookmark_id)
+    if bookmark is None or field not in bookmark:
+        response = http_client.get(f"{HORADER_API_URL}/{bookmark_id}", headers=HEADERS, timeout=10)
+        response.raise_for_status()
+        bookmark = response.json()
+    return bool(bookmark.get(field, False))
+
+def run_action(action, bookmark_id, state):
+    """Send one action to the server. Returns (succeeded, message, updated bookmark)."""
+    url = f"{HORADER_API_URL}/{bookmark_id}"
+    try:
+        if action == "delete":
+            response = http_client.delete(url, headers=HEADERS, timeout=10)
+            if response.status_code in (200, 204):
+                return True, f"Bookmark {bookmark_id} deleted successfully.", None
+            return False, f"Failed to delete bookmark {bookmark_id}. HTTP Status: {response.status_code}", None
+
+        field = TOGGLE_FIELDS[action]
+        response = http_client.patch(url, headers=HEADERS, json={field: state}, timeout=10)
+        name = "archived" if action == "archive" else "favourite"
+        if response.status_code == 200:
+            return True, f"Bookmark {bookmark_id} {name} state toggled to {json.dumps(state)}.", response.json()
+        return False, (
+            f"Failed to toggle {action} state for bookmark {bookmark_id}. HTTP Status: {response.status_code}\n"
+            f"Response: {response.text}"
+        ), None
+    except (http_client.RequestError, ValueError) as e:
+        return False, f"Failed to {action} bookmark {bookmark_id}: {e}", None
+
+def run_actions(arguments):
+    """
+    Run "action:id[:state]" pairs concurrently and print one line per action.
+
+    The local mirror is updated before the requests are sent and rolled back
+    for the ones that fail.
+    """
+    jobs, messages = [], []
+    for text in arguments:
+        parsed = parse_action(text)
+        if parsed is None or (parsed[0] != "delete" and parsed[0] not in TOGGLE_FIELDS):
+            messages.append(f"Unknown action: {text.split(':')[0]}")
+            continue
+        action, bookmark_id, state = parsed
+        try:
+            if action in TOGGLE_FIELDS and state is None:
+                state = not current_state(bookmark_id, TOGGLE_FIELDS[action])
+        except http_client.RequestError as e:
+            messages.append(f"Failed to {action} bookmark {bookmark_id}: {e}")
+            continue
+
+        # optimistic update, keeping the old copy to roll back to
+        if action == "delete":
+            previous = bookmark_store.remove_bookmark(bookmark_id)
+        else:
+            previous = bookmark_store.update_bookmark(bookmark_id, {TOGGLE_FIELDS[action]: state})
+        jobs.append((action, bookmark_id, state, previous))
+
+    if jobs:
+        with ThreadPoolExecutor(max_workers=min(ACTION_WORKERS, len(jobs))) as executor:
+            results = list(executor.map(lambda job: run_action(*job[:3]), jobs))
+
+        with bookmark_store.connect():
+            for (action, bookmark_id, state, previous), (succeeded, message, updated) in zip(jobs, results):
+                messages.append(message)
+                if succeeded and updated and previous is not None:
+                    # PATCH answers with the bare bookmark, without content, tags or assets
+                    field = TOGGLE_FIELDS[action]
+                    changes = {field: updated.get(field, state)}
+                    if updated.get("modifiedAt"):
+                        changes["modifiedAt"] = updated["modifiedAt"]
+                    bookmark_store.update_bookmark(bookmark_id, changes)
+                elif not succeeded and previous is not None:
+                    if action == "delete":
+                        bookmark_store.restore_bookmark(previous)
+                    else:
+                        bookmark_store.update_bookmark(bookmark_id, {TOGGLE_FIELDS[action]: previous.get(TOGGLE_FIELDS[action])})
+
+        # cached lists may still contain a deleted bookmark or the old state
+        if any(succeeded for succeeded, _, _ in results):
+            result_cache.clear()
+        else:
+            # the mirror was changed and rolled back; lists rendered in between are stale
+            result_cache.bump_generation()
+
+    print("\n".join(messages))
+
+if __name__ == "__main__":
+    # python3 actions.py "archive:<id>[:true|false]" ["delete:<id>" ...]
+    arguments = [text for argument in sys.argv[1:] for text in argument.split()]
+    if not arguments:
+        print("No action provided")
+        sys.exit(1)
+    run_actions(arguments)
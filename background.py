@@ -0,0 +1,105 @@
+import bundle
+bundle.install()
+import os
+import sys
+import json
+import fcntl
+import importlib
+import threading
+from pathlib import Path
+import daemon_client
+import timings
+from config import CACHE_DIR, ensure_cache_dir
+
+# Tasks queued by the script filters, one JSON line each: [module, function, args]
+QUEUE_PATH = CACHE_DIR / "tasks.jsonl"
+# Held by the worker running the queue, so concurrent keystrokes do not start competing ones
+WORKER_LOCK_PATH = CACHE_DIR / "background.lock"
+
+def submit(module, function, *args):
+    """Queue module.function(*args) to run once the script's output has been sent"""
+    ensure_cache_dir()
+    with open(QUEUE_PATH, "a") as queue:
+        fcntl.flock(queue, fcntl.LOCK_EX)
+        queue.write(json.dumps([module, function, list(args)]) + "\n")
+
+def pending():
+    try:
+        return QUEUE_PATH.stat().st_size > 0
+    except FileNotFoundError:
+        return False
+
+def take_tasks():
+    """Claim every queued task, dropping duplicates"""
+    try:
+        with open(QUEUE_PATH, "r+") as queue:
+            fcntl.flock(queue, fcntl.LOCK_EX)
+            lines = queue.read().splitlines()
+            queue.seek(0)
+            queue.truncate()
+    except FileNotFoundError:
+        return []
+
+    tasks = []
+    for line in dict.fromkeys(lines):
+        try:
+            tasks.append(json.loads(line))
+        except ValueError:
+            continue
+    return tasks
+
+def run_task(module, function, args):
+    try:
+        getattr(importlib.import_module(module), function)(*args)
+    except Exception as e:
+        print(f"Background task {module}.{function} failed: {e!r}", file=sys.stderr)
+
+def drain():
+    """Run queued tasks until the queue is empty, unless another worker already does"""
+    ensure_cache_dir()
+    while True:
+        with open(WORKER_LOCK_PATH, "w") as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return  # the running worker checks the queue again before it exits
+            tasks = take_tasks()
+            while tasks:
+                for module, function, args in tasks:
+                    run_task(module, function, args)
+                tasks = take_tasks()
+        # tasks queued while a worker that gave up on the lock saw it still held
+        if not pending():
+            return
+
+def finish_output():
+    """Flush and close stdout, so Alfred has the results before any background work"""
+    sys.stdout.flush()
+    timings.elapsed("output")
+    if daemon_client.IN_DAEMON:
+        return  # output is captured and sent by the daemon
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    os.dup2(devnull, sys.stdout.fileno())
+    os.close(devnull)
+
+def start():
+    """Run the queued tasks: in a thread inside the daemon, otherwise in a detached process"""
+    if not pending():
+        return
+    if daemon_client.IN_DAEMON:
+        threading.Thread(target=drain, name="hoarder-background").start()
+        return
+
+    import subprocess
+    subprocess.Popen(
+        [sys.executable, str(Path(__file__))],
+        cwd=str(Path(__file__).parent),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+
+if __name__ == "__main__":
+    # python3 background.py: run whatever is queued
+    drain()
@@ -0,0 +1,419 @@
+import http_client
+import json
+import sys
+import time
+import fcntl
+import sqlite3
+import search_index
+import result_cache
+from render import lean_bookmark
+from config import (
+    CACHE_DIR,
+    HORADER_API_URL,
+    HOARDER_TAGS_API_URL,
+    HEADERS,
+    SYNC_INTERVAL,
+    FULL_SYNC_INTERVAL,
+    ensure_cache_dir
+)
+
+DB_PATH = CACHE_DIR / "bookmarks.db"
+SYNC_LOCK_PATH = CACHE_DIR / "sync.lock"
+SYNC_PAGE_SIZE = 100
+# Bumped whenever existing databases need a migration step in connect()
+SCHEMA_VERSION = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bookmarks (
+    id TEXT PRIMARY KEY,
+    created_at TEXT,
+    modified_at TEXT,
+    generation INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS bookmarks_created_at ON bookmarks (created_at DESC);
+CREATE TABLE IF NOT EXISTS tags (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    name_key TEXT,
+    num_bookmarks INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bookmark_tags (
+    bookmark_id TEXT NOT NULL,
+    tag_id TEXT NOT NULL,
+    PRIMARY KEY (bookmark_id, tag_id)
+);
+CREATE INDEX IF NOT EXISTS bookmark_tags_tag_id ON bookmark_tags (tag_id);
+CREATE TABLE IF NOT EXISTS assets (
+    id TEXT PRIMARY KEY,
+    bookmark_id TEXT NOT NULL,
+    asset_type TEXT
+);
+CREATE INDEX IF NOT EXISTS assets_bookmark_id ON assets (bookmark_id);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_connection = None
+_full_text_search = False
+
+def connect():
+    """Open (once per process) the local mirror database"""
+    global _connection, _full_text_search
+    if _connection is None:
+        ensure_cache_dir()
+        db = sqlite3.connect(str(DB_PATH), timeout=5)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("PRAGMA synchronous=NORMAL")
+        db.executescript(SCHEMA)
+        _full_text_search = search_index.create(db)
+
+        version = db.execute("PRAGMA user_version").fetchone()[0]
+        if version < SCHEMA_VERSION:
+            with db:
+                # case-folded tag names for the tag name -> ID index
+                if version < 2:
+                    columns = [row[1] for row in db.execute("PRAGMA table_info(tags)")]
+                    if "name_key" not in columns:
+                        db.execute("ALTER TABLE tags ADD COLUMN name_key TEXT")
+                    db.executemany(
+                        "UPDATE tags SET name_key = ? WHERE id = ?",
+                        [(name.casefold(), tag_id) for tag_id, name in db.execute("SELECT id, name FROM tags").fetchall()]
+                    )
+                # full text rows keyed by the bookmarks' rowids
+                if version < 3 and _full_text_search:
+                    search_index.rekey(db)
+                db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        if _full_text_search and missing_index(db):
+            with db:
+                reindex(db)
+        db.execute("CREATE INDEX IF NOT EXISTS tags_name_key ON tags (name_key)")
+        _connection = db
+    return _connection
+
+def missing_index(db):
+    """Whether bookmarks were mirrored before the full text index existed, or by a SQLite without FTS5"""
+    return (
+        db.execute("SELECT EXISTS (SELECT 1 FROM bookmarks)").fetchone()[0]
+        and not db.execute("SELECT EXISTS (SELECT 1 FROM bookmarks_fts)").fetchone()[0]
+    )
+
+def reindex(db):
+    """
+    Index the stored bookmarks, and mark them unsynced so the next sync
+    fetches them again with the page content the stored copies lack.
+    """
+    search_index.rebuild(db, [(rowid, json.loads(data)) for rowid, data in db.execute("SELECT rowid, data FROM bookmarks")])
+    db.execute("UPDATE bookmarks SET modified_at = NULL")
+
+def get_state(key, default=None):
+    row = connect().execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+def set_state(key, value):
+    connect().execute(
+        "INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)",
+        (key, None if value is None else str(value))
+    )
+
+def is_synced():
+    """True once the mirror has completed at least one sync"""
+    return get_state("last_sync") is not None
+
+def _load(rows):
+    return [json.loads(row[0]) for row in rows]
+
+def upsert_bookmark(bookmark, generation=0):
+    """
+    Store a bookmark with its tags and assets. Returns True if it changed.
+
+    Page content only goes into the full text index; the stored copy is lean,
+    so list and search views load and parse a fraction of the data.
+    """
+    db = connect()
+    bookmark_id = bookmark.get("id")
+    modified_at = bookmark.get("modifiedAt") or bookmark.get("createdAt")
+    row = db.execute("SELECT rowid, modified_at FROM bookmarks WHERE id = ?", (bookmark_id,)).fetchone()
+    changed = row is None or row[1] != modified_at
+
+    if changed:
+        values = (bookmark.get("createdAt"), modified_at, generation, json.dumps(lean_bookmark(bookmark)))
+        # updated in place, so the rowid (the full text index key) stays the same
+        if row is None:
+            rowid = db.execute(
+                "INSERT INTO bookmarks (id, created_at, modified_at, generation, data) VALUES (?, ?, ?, ?, ?)",
+                (bookmark_id,) + values
+            ).lastrowid
+        else:
+            rowid = row[0]
+            db.execute(
+                "UPDATE bookmarks SET created_at = ?, modified_at = ?, generation = ?, data = ? WHERE rowid = ?",
+                values + (rowid,)
+            )
+        db.execute("DELETE FROM bookmark_tags WHERE bookmark_id = ?", (bookmark_id,))
+        db.executemany(
+            "INSERT OR IGNORE INTO bookmark_tags (bookmark_id, tag_id) VALUES (?, ?)",
+            [(bookmark_id, tag.get("id")) for tag in bookmark.get("tags", []) if tag.get("id")]
+        )
+        db.execute("DELETE FROM assets WHERE bookmark_id = ?", (bookmark_id,))
+        db.executemany(
+            "INSERT OR REPLACE INTO assets (id, bookmark_id, asset_type) VALUES (?, ?, ?)",
+            [(asset.get("id"), bookmark_id, asset.get("assetType")) for asset in bookmark.get("assets", []) if asset.get("id")]
+        )
+        if _full_text_search:
+            search_index.index_bookmark(db, rowid, bookmark)
+    else:
+        db.execute("UPDATE bookmarks SET generation = ? WHERE id = ?", (generation, bookmark_id))
+
+    return changed
+
+def delete_bookmarks(bookmark_ids):
+    db = connect()
+    if _full_text_search:
+        rows = [db.execute("SELECT rowid FROM bookmarks WHERE id = ?", (i,)).fetchone() for i in bookmark_ids]
+        search_index.remove(db, [row[0] for row in rows if row is not None])
+    for table, column in (("bookmarks", "id"), ("bookmark_tags", "bookmark_id"), ("assets", "bookmark_id")):
+        db.executemany(f"DELETE FROM {table} WHERE {column} = ?", [(i,) for i in bookmark_ids])
+
+def remove_bookmark(bookmark_id):
+    """
+    Delete a mirrored bookmark, e.g. right before deleting it on the server.
+    Returns its rows for restore_bookmark(), or None if it is not mirrored.
+    """
+    db = connect()
+    row = db.execute(
+        "SELECT rowid, id, created_at, modified_at, generation, data FROM bookmarks WHERE id = ?", (bookmark_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    saved = {
+        "bookmark": row,
+        "tags": db.execute("SELECT bookmark_id, tag_id FROM bookmark_tags WHERE bookmark_id = ?", (bookmark_id,)).fetchall(),
+        "assets": db.execute("SELECT id, bookmark_id, asset_type FROM assets WHERE bookmark_id = ?", (bookmark_id,)).fetchall(),
+        "fts": None
+    }
+    if _full_text_search:
+        # the stored copy is lean; the page content only survives in the index
+        saved["fts"] = db.execute(
+            f"SELECT {', '.join(search_index.COLUMNS)} FROM bookmarks_fts WHERE rowid = ?", (row[0],)
+        ).fetchone()
+    with db:
+        delete_bookmarks([bookmark_id])
+    return saved
+
+def restore_bookmark(saved):
+    """Put back a bookmark removed by remove_bookmark(), including its full text index row"""
+    db = connect()
+    with db:
+        # a sync may have stored it again meanwhile
+        delete_bookmarks([saved["bookmark"][1]])
+        rowid = db.execute(
+            "INSERT INTO bookmarks (id, created_at, modified_at, generation, data) VALUES (?, ?, ?, ?, ?)",
+            saved["bookmark"][1:]
+        ).lastrowid
+        db.executemany("INSERT OR IGNORE INTO bookmark_tags (bookmark_id, tag_id) VALUES (?, ?)", saved["tags"])
+        db.executemany("INSERT OR REPLACE INTO assets (id, bookmark_id, asset_type) VALUES (?, ?, ?)", saved["assets"])
+        if _full_text_search and saved["fts"] is not None:
+            db.execute(
+                f"INSERT INTO bookmarks_fts (rowid, {', '.join(search_index.COLUMNS)}) "
+                f"VALUES (?, {', '.join('?' for _ in search_index.COLUMNS)})",
+                (rowid,) + tuple(saved["fts"])
+            )
+
+def update_bookmark(bookmark_id, changes):
+    """
+    Apply changed fields to a mirrored bookmark, e.g. right after archiving it.
+    Tags, assets and the full text index are left as they are. A changed
+    modifiedAt is stored too, so the next sync sees the bookmark as current.
+    Returns the bookmark as it was, or None if it is not mirrored.
+    """
+    db = connect()
+    row = db.execute("SELECT data FROM bookmarks WHERE id = ?", (bookmark_id,)).fetchone()
+    if row is None:
+        return None
+    bookmark = json.loads(row[0])
+    updated = dict(bookmark, **changes)
+    with db:
+        db.execute(
+            "UPDATE bookmarks SET data = ?, modified_at = ? WHERE id = ?",
+            (json.dumps(updated), updated.get("modifiedAt") or updated.get("createdAt"), bookmark_id)
+        )
+    return bookmark
+
+def replace_tags(tags):
+    """Replace the stored tag list with the one returned by /api/v1/tags"""
+    db = connect()
+    rows = [
+        (tag.get("id"), tag.get("name", ""), tag.get("name", "").casefold(), tag.get("numBookmarks", 0), json.dumps(tag))
+        for tag in tags
+    ]
+    changed = sorted(db.execute("SELECT id, name, name_key, num_bookmarks, data FROM tags")) != sorted(rows)
+    with db:
+        db.execute("DELETE FROM tags")
+        db.executemany("INSERT INTO tags (id, name, name_key, num_bookmarks, data) VALUES (?, ?, ?, ?, ?)", rows)
+        set_state("tags_fetched_at", time.time())
+    if changed:
+        result_cache.bump_generation()
+
+def sync_tags():
+    response = http_client.get(HOARDER_TAGS_API_URL, headers=HEADERS, timeout=10)
+    response.raise_for_status()
+    replace_tags(response.json().get("tags", []))
+
+def sync(full=False):
+    """
+    Incrementally mirror bookmarks by walking the v1 API cursor pagination.
+
+    The API lists bookmarks newest first and has no "modified since" filter, so an
+    incremental sync stops at the first page where nothing changed. A full sync walks
+    every page (resuming from a saved cursor if a previous one was interrupted), and
+    then drops bookmarks that no longer exist on the server.
+    """
+    db = connect()
+    cursor = get_state("full_sync_cursor") if full else None
+    # every bookmark seen during a sync is stamped with the current generation
+    generation = int(get_state("full_sync_generation", "0"))
+    if full and cursor is None:
+        generation += 1
+        with db:
+            set_state("full_sync_generation", generation)
+
+    changed_count = 0
+    while True:
+        params = {"limit": SYNC_PAGE_SIZE, "includeContent": "true"}
+        if cursor:
+            params["cursor"] = cursor
+        # only the first page is requested again by the next sync
+        response = http_client.get(HORADER_API_URL, revalidate=not cursor, headers=HEADERS, params=params, timeout=30)
+        response.raise_for_status()
+        data = response.json()
+
+        bookmarks = data.get("bookmarks", [])
+        cursor = data.get("nextCursor")
+        with db:
+            page_changes = sum(upsert_bookmark(bookmark, generation) for bookmark in bookmarks)
+            if full:
+                set_state("full_sync_cursor", cursor)
+        changed_count += page_changes
+
+        if not cursor or (not full and page_changes == 0):
+            break
+
+    stale = []
+    with db:
+        if full:
+            stale = [row[0] for row in db.execute("SELECT id FROM bookmarks WHERE generation < ?", (generation,))]
+            delete_bookmarks(stale)
+            set_state("full_sync_cursor", None)
+            set_state("last_full_sync", time.time())
+        set_state("last_sync", time.time())
+    if changed_count or stale:
+        result_cache.bump_generation()
+
+    sync_tags()
+    return changed_count
+
+def sync_due():
+    """None while the mirror is fresh, otherwise whether the sync due is a full one"""
+    now = time.time()
+    last_sync = float(get_state("last_sync", "0"))
+    last_full_sync = float(get_state("last_full_sync", "0"))
+    full = now - last_full_sync > FULL_SYNC_INTERVAL
+    if not full and now - last_sync < SYNC_INTERVAL:
+        return None
+    return full
+
+def sync_if_stale():
+    """Run an incremental (or, when due, full) sync unless another process is syncing"""
+    full = sync_due()
+    if full is None:
+        return 0
+
+    with open(SYNC_LOCK_PATH, "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return 0
+        return sync(full=full)
+
+def recent_bookmarks(limit=20):
+    rows = connect().execute(
+        "SELECT data FROM bookmarks ORDER BY created_at DESC LIMIT ?", (limit,)
+    )
+    return _load(rows)
+
+def get_bookmarks(bookmark_ids):
+    """Load bookmarks by id, keeping the order of bookmark_ids"""
+    rows = connect().execute(
+        f"SELECT id, data FROM bookmarks WHERE id IN ({', '.join('?' for _ in bookmark_ids)})",
+        list(bookmark_ids)
+    )
+    by_id = {row[0]: row[1] for row in rows}
+    return [json.loads(by_id[i]) for i in bookmark_ids if i in by_id]
+
+def search_bookmarks(query, limit=20):
+    """Rank bookmarks with BM25 over title, URL, description, note, summary, content and tags"""
+    terms = query.split()
+    if not terms:
+        return recent_bookmarks(limit)
+    db = connect()
+    if _full_text_search:
+        return get_bookmarks(search_index.search(db, query, limit))
+
+    # SQLite without FTS5: match every query term against the stored bookmark JSON,
+    # which is lean, so page content is not searched
+    where = " AND ".join("data LIKE ?" for _ in terms)
+    rows = db.execute(
+        f"SELECT data FROM bookmarks WHERE {where} ORDER BY created_at DESC LIMIT ?",
+        [f"%{term}%" for term in terms] + [limit]
+    )
+    return _load(rows)
+
+def list_tags():
+    rows = connect().execute("SELECT data FROM tags ORDER BY num_bookmarks DESC")
+    return _load(rows)
+
+def tag_id_by_name(tag_name, max_age=None):
+    """
+    Look up a tag ID by case-folded name in the stored tag list.
+
+    Returns None if the tag is unknown, or if the list is older than max_age
+    seconds, so the caller can reload it.
+    """
+    if max_age is not None and time.time() - float(get_state("tags_fetched_at", 0)) > max_age:
+        return None
+    row = connect().execute("SELECT id FROM tags WHERE name_key = ?", (tag_name.casefold(),)).fetchone()
+    return row[0] if row else None
+
+def bookmarks_by_tag_name(tag_name, limit=50):
+    rows = connect().execute(
+        "SELECT b.data FROM bookmarks b "
+        "JOIN bookmark_tags bt ON bt.bookmark_id = b.id "
+        "JOIN tags t ON t.id = bt.tag_id "
+        "WHERE t.name_key = ? "
+        "ORDER BY b.created_at DESC LIMIT ?",
+        (tag_name.casefold(), limit)
+    )
+    return _load(rows)
+
+def icon_references():
+    """(favicon URL, asset ID) of every mirrored bookmark"""
+    return connect().execute(
+        "SELECT json_extract(data, '$.content.favicon'), json_extract(data, '$.content.assetId') FROM bookmarks"
+    ).fetchall()
+
+def get_bookmark(bookmark_id):
+    row = connect().execute("SELECT data FROM bookmarks WHERE id = ?", (bookmark_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+if __name__ == "__main__":
+    # python3 bookmark_store.py [--full]
+    try:
+        count = sync(full="--full" in sys.argv[1:])
+        print(f"Synced {count} changed bookmarks", file=sys.stderr)
+    except http_client.RequestError as e:
+        print(f"Error syncing bookmarks: {e}", file=sys.stderr)
+        sys.exit(1)
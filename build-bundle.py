@@ -0,0 +1,58 @@
+import os
+import sys
+import marshal
+import zipfile
+from pathlib import Path
+from importlib.machinery import EXTENSION_SUFFIXES
+from bundle import WORKFLOW_DIR, BUNDLE_PATH, TRAILER_PREFIX
+
+# Bytecode optimization level: 2 drops asserts and docstrings
+BUNDLE_OPTIMIZE = 2
+LIBS_DIR = Path(WORKFLOW_DIR) / "libs"
+
+def workflow_modules():
+    """Importable workflow modules; scripts with a dash in the name always run from source"""
+    for path in sorted(Path(WORKFLOW_DIR).glob("*.py")):
+        if "-" not in path.stem and path.stem != "bundle":
+            yield path.stem, path, False
+
+def lib_modules():
+    """Pure Python modules and packages under libs/"""
+    for path in sorted(LIBS_DIR.rglob("*.py")):
+        relative = path.relative_to(LIBS_DIR)
+        if "__pycache__" in relative.parts or not relative.parts[0].isidentifier():
+            continue
+        # a compiled extension would take precedence over the source on a normal import
+        if any(path.with_name(path.stem + suffix).exists() for suffix in EXTENSION_SUFFIXES):
+            continue
+        if path.stem == "__init__":
+            yield ".".join(relative.parts[:-1]), path, True
+        else:
+            yield ".".join(relative.with_suffix("").parts), path, False
+
+def build():
+    """Compile every module into bundle.zip, with an index of where each one starts"""
+    modules = {}
+    partial_path = f"{BUNDLE_PATH}.{os.getpid()}"
+    with zipfile.ZipFile(partial_path, "w", zipfile.ZIP_STORED) as archive:
+        for name, path, is_package in list(workflow_modules()) + list(lib_modules()):
+            relative_path = str(path.relative_to(WORKFLOW_DIR))
+            # relative file names, so tracebacks still find the sources if the workflow moves
+            code = compile(path.read_bytes(), relative_path, "exec", dont_inherit=True, optimize=BUNDLE_OPTIMIZE)
+            data = marshal.dumps(code)
+            archive.writestr(f"{name}.code", data)
+            stat = path.stat()
+            # workflow modules are checked for edits when imported; libs/ only changes on rebuild
+            stamp = (stat.st_mtime_ns, stat.st_size) if path.parent == Path(WORKFLOW_DIR) else None
+            modules[name] = (archive.fp.tell() - len(data), len(data), is_package, relative_path, stamp)
+
+        index = marshal.dumps({"cache_tag": sys.implementation.cache_tag, "modules": modules})
+        archive.writestr("index.marshal", index)
+        archive.comment = TRAILER_PREFIX + b"%012d %012d" % (archive.fp.tell() - len(index), len(index))
+    os.replace(partial_path, BUNDLE_PATH)
+    return modules
+
+if __name__ == "__main__":
+    # python3 build-bundle.py: rebuild bundle.zip after changing libs/ or updating Python
+    modules = build()
+    print(f"{len(modules)} modules -> {BUNDLE_PATH} ({os.path.getsize(BUNDLE_PATH) / 1024:.0f} KB)")
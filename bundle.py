@@ -0,0 +1,86 @@
+import os
+import sys
+import marshal
+# the import system's own ModuleSpec, already loaded; importlib.machinery is not
+from _frozen_importlib import ModuleSpec
+from config import HOARDER_BUNDLE
+
+WORKFLOW_DIR = os.path.dirname(os.path.abspath(__file__))
+# Built by build-bundle.py: libs/ and the workflow modules as bytecode in one zip
+BUNDLE_PATH = os.path.join(WORKFLOW_DIR, "bundle.zip")
+# The zip comment holds the offset and size of the module index
+TRAILER_PREFIX = b"hoarder-bundle "
+TRAILER_SIZE = len(TRAILER_PREFIX) + 25
+
+class BundleFinder:
+    """
+    Import modules from the bundle's index instead of searching sys.path.
+
+    Modules keep their real paths as __file__, so CACHE_DIR and the CA bundle
+    of certifi still resolve next to the sources. A workflow module edited
+    after the bundle was built is imported from its source instead.
+    """
+
+    def __init__(self, fd, modules):
+        self.fd = fd
+        self.modules = modules
+
+    def find_spec(self, fullname, path=None, target=None):
+        entry = self.modules.get(fullname)
+        if entry is None:
+            return None
+        _, _, is_package, relative_path, stamp = entry
+        origin = os.path.join(WORKFLOW_DIR, relative_path)
+        if stamp is not None:
+            try:
+                stat = os.stat(origin)
+            except OSError:
+                return None
+            if (stat.st_mtime_ns, stat.st_size) != stamp:
+                return None
+        spec = ModuleSpec(fullname, self, origin=origin, is_package=is_package)
+        spec.has_location = True
+        if is_package:
+            spec.submodule_search_locations = [os.path.dirname(origin)]
+        return spec
+
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        offset, size = self.modules[module.__name__][:2]
+        # pread, as modules may be imported from several threads at once
+        exec(marshal.loads(os.pread(self.fd, size, offset)), module.__dict__)
+
+    def get_source(self, fullname):
+        with open(os.path.join(WORKFLOW_DIR, self.modules[fullname][3]), encoding="utf-8") as source:
+            return source.read()
+
+def read_index(fd):
+    """The bundle's module index, or None if it was built for another Python"""
+    size = os.fstat(fd).st_size
+    trailer = os.pread(fd, TRAILER_SIZE, size - TRAILER_SIZE)
+    if not trailer.startswith(TRAILER_PREFIX):
+        return None
+    offset, length = (int(value) for value in trailer[len(TRAILER_PREFIX):].split())
+    index = marshal.loads(os.pread(fd, length, offset))
+    if index.get("cache_tag") != sys.implementation.cache_tag:
+        return None
+    return index["modules"]
+
+def install():
+    """Import from bundle.zip when it exists; call before importing anything it holds"""
+    if not HOARDER_BUNDLE or any(isinstance(finder, BundleFinder) for finder in sys.meta_path):
+        return
+    try:
+        fd = os.open(BUNDLE_PATH, os.O_RDONLY | os.O_CLOEXEC)
+    except OSError:
+        return
+    try:
+        modules = read_index(fd)
+    except (OSError, ValueError, EOFError, TypeError):
+        modules = None
+    if modules is None:
+        os.close(fd)
+        return
+    sys.meta_path.insert(0, BundleFinder(fd, modules))
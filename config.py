@@ -0,0 +1,80 @@
+import os
+from pathlib import Path
+
+# cache at current directory
+CACHE_DIR = Path(__file__).parent / "cache"
+HOARDER_SERVER_ADDR = os.getenv("HOARDER_SERVER_ADDR")
+HORADER_API_URL = f"{HOARDER_SERVER_ADDR}/api/v1/bookmarks"
+HOARDER_SEARCH_API_URL = f"{HOARDER_SERVER_ADDR}/api/trpc/bookmarks.searchBookmarks"
+HOARDER_TAGS_API_URL = f"{HOARDER_SERVER_ADDR}/api/v1/tags"
+HOARDER_API_KEY = os.getenv("HOARDER_API_KEY")
+HEADERS = {
+    "Accept": "application/json",
+    "Authorization": f"Bearer {HOARDER_API_KEY}"
+}
+TAGS_SHOWN_COUNT = int(os.getenv("TAGS_SHOWN_COUNT", "0"))
+# Seconds the stored tag name -> ID index is trusted before the tag list is reloaded
+TAG_INDEX_TTL = int(os.getenv("TAG_INDEX_TTL", "86400"))
+# Pages of 50 bookmarks loaded when browsing a tag
+TAG_MAX_PAGES = int(os.getenv("TAG_MAX_PAGES", "20"))
+
+# Answer list/search/tag views from the local SQLite mirror once it has been synced
+LOCAL_MIRROR = os.getenv("LOCAL_MIRROR", "0") == "1"
+# Seconds between incremental syncs of the local mirror
+SYNC_INTERVAL = int(os.getenv("SYNC_INTERVAL", "300"))
+# Seconds between full syncs (catches edits to old bookmarks and deletions)
+FULL_SYNC_INTERVAL = int(os.getenv("FULL_SYNC_INTERVAL", "86400"))
+
+# Seconds a cached search/list result is shown without refreshing it in the background
+RESULT_CACHE_TTL = int(os.getenv("RESULT_CACHE_TTL", "60"))
+# Seconds after which a cached result is no longer shown at all
+RESULT_CACHE_MAX_AGE = int(os.getenv("RESULT_CACHE_MAX_AGE", "86400"))
+# Number of cached queries kept (least recently used are evicted)
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "200"))
+# Details of this many top results are fetched in the background (0 turns it off)
+DETAIL_PREFETCH_COUNT = int(os.getenv("DETAIL_PREFETCH_COUNT", "5"))
+
+# Size and file count budget of the favicon/thumbnail cache
+ICON_CACHE_MAX_MB = int(os.getenv("ICON_CACHE_MAX_MB", "100"))
+ICON_CACHE_MAX_ENTRIES = int(os.getenv("ICON_CACHE_MAX_ENTRIES", "20000"))
+
+# Serve script filters from the long-lived hoarder daemon (see hoarder-daemon.py)
+HOARDER_DAEMON = os.getenv("HOARDER_DAEMON", "0") == "1"
+# Seconds without requests before the daemon exits
+DAEMON_IDLE_TIMEOUT = int(os.getenv("DAEMON_IDLE_TIMEOUT", "1800"))
+# Seconds the daemon reuses the output of an identical list/search/tag request
+DAEMON_MEMO_TTL = int(os.getenv("DAEMON_MEMO_TTL", "15"))
+
+# Import modules from bundle.zip when it has been built (see build-bundle.py)
+HOARDER_BUNDLE = os.getenv("HOARDER_BUNDLE", "1") == "1"
+# Append the time spent in each phase of every script run to cache/trace.log (see hoarder-stats.py)
+HOARDER_TRACE = os.getenv("HOARDER_TRACE", "0") == "1"
+# Profile every script run: "cpu", "memory" or both (see profiling.py; cache/profile also turns it on)
+HOARDER_PROFILE = os.getenv("HOARDER_PROFILE", "")
+
+# Environment variables read above; a running daemon restarts when any of them change
+SETTINGS = (
+    "HOARDER_SERVER_ADDR",
+    "HOARDER_API_KEY",
+    "TAGS_SHOWN_COUNT",
+    "TAG_INDEX_TTL",
+    "TAG_MAX_PAGES",
+    "LOCAL_MIRROR",
+    "SYNC_INTERVAL",
+    "FULL_SYNC_INTERVAL",
+    "RESULT_CACHE_TTL",
+    "RESULT_CACHE_MAX_AGE",
+    "RESULT_CACHE_MAX_ENTRIES",
+    "DETAIL_PREFETCH_COUNT",
+    "ICON_CACHE_MAX_MB",
+    "ICON_CACHE_MAX_ENTRIES",
+    "HOARDER_DAEMON",
+    "DAEMON_IDLE_TIMEOUT",
+    "DAEMON_MEMO_TTL",
+    "HOARDER_BUNDLE",
+    "HOARDER_TRACE",
+    "HOARDER_PROFILE",
+)
+
+def ensure_cache_dir():
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
@@ -0,0 +1,81 @@
+import os
+import sys
+import json
+import socket
+import hashlib
+from pathlib import Path
+from config import HOARDER_DAEMON, SETTINGS
+
+WORKFLOW_DIR = Path(__file__).parent
+# Unix socket paths are limited to ~104 bytes on macOS, too short for the workflow folder
+SOCKET_PATH = Path(os.getenv("TMPDIR", "/tmp")) / (
+    "hoarder-" + hashlib.md5(str(WORKFLOW_DIR.resolve()).encode()).hexdigest()[:12] + ".sock"
+)
+DAEMON_SCRIPT = WORKFLOW_DIR / "hoarder-daemon.py"
+CONNECT_TIMEOUT = 0.2
+RESPONSE_TIMEOUT = 60
+
+# Set by the daemon so scripts it runs in-process do not forward to themselves
+IN_DAEMON = False
+
+def settings_fingerprint(environ):
+    return {name: environ.get(name) for name in SETTINGS}
+
+def send_request(request, timeout=RESPONSE_TIMEOUT):
+    """Send one JSON request line to the daemon and return its JSON reply"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.settimeout(CONNECT_TIMEOUT)
+        client.connect(str(SOCKET_PATH))
+        client.settimeout(timeout)
+        client.sendall(json.dumps(request).encode() + b"\n")
+        with client.makefile("rb") as reply:
+            return json.loads(reply.readline())
+
+def start_daemon():
+    """Start the daemon detached from this process; it serves later invocations"""
+    import subprocess
+    subprocess.Popen(
+        [sys.executable, str(DAEMON_SCRIPT)],
+        cwd=str(WORKFLOW_DIR),
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True
+    )
+
+def forward_to_daemon(script_path):
+    """
+    Run this script invocation inside the hoarder daemon, if enabled.
+
+    On success the daemon's output is printed and the process exits here, before
+    the caller imports the HTTP stack. Otherwise this returns and the script continues
+    with its usual direct path.
+    """
+    if not HOARDER_DAEMON or IN_DAEMON:
+        return
+
+    request = {
+        "script": Path(script_path).name,
+        "argv": sys.argv[1:],
+        "env": dict(os.environ),
+        "settings": settings_fingerprint(os.environ)
+    }
+    try:
+        reply = send_request(request)
+    except (FileNotFoundError, ConnectionRefusedError):
+        start_daemon()
+        return
+    except (OSError, ValueError) as e:
+        print(f"Hoarder daemon unavailable: {e}", file=sys.stderr)
+        return
+
+    if reply.get("status") == "superseded":
+        # a newer invocation of this script is queued; its output replaces this one's
+        sys.exit(0)
+    if reply.get("status") != "ok":
+        # e.g. settings changed: the daemon exits and is restarted next time
+        return
+    sys.stderr.write(reply.get("stderr", ""))
+    sys.stdout.write(reply.get("stdout", ""))
+    sys.stdout.flush()
+    sys.exit(reply.get("exit_code", 0))
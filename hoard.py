@@ -1,8 +1,19 @@
-import requests
+import bundle
+bundle.install()
+import timings
+import profiling
+
+if __name__ == "__main__":
+    timings.start(__file__)
+    profiling.start(__file__)
+
+import http_client
 import json
 import sys
 import os
 
+timings.mark("imports")
+
 HOARDER_SERVER_ADDR = os.getenv("HOARDER_SERVER_ADDR")
 HOARDER_API_URL = f"{HOARDER_SERVER_ADDR}/api/v1/bookmarks"
 HOARDER_API_KEY = os.getenv("HOARDER_API_KEY")
@@ -40,12 +51,12 @@ def add_bookmark(url):
 
     try:
         payload = create_payload(url, "link")
-        response = requests.post(HOARDER_API_URL, headers=HEADERS, json=payload)
+        response = http_client.post(HOARDER_API_URL, headers=HEADERS, json=payload)
         response.raise_for_status()
         data = response.json()
         bookmark_id = data.get("id", "Unknown ID")
         return f"{HOARDER_SERVER_ADDR}/dashboard/preview/{bookmark_id}"
-    except requests.exceptions.RequestException as e:
+    except http_client.RequestError as e:
         error_detail = ""
         if hasattr(e.response, 'text'):
             try:
@@ -56,12 +67,12 @@ def add_bookmark(url):
                     try:
                         text_payload = create_payload(url, "text")
                         #print(f"Trying text payload: {json.dumps(text_payload, indent=2)}")
-                        response = requests.post(HOARDER_API_URL, headers=HEADERS, json=text_payload)
+                        response = http_client.post(HOARDER_API_URL, headers=HEADERS, json=text_payload)
                         response.raise_for_status()
                         data = response.json()
                         bookmark_id = data.get("id", "Unknown ID")
                         return f"{HOARDER_SERVER_ADDR}/dashboard/preview/{bookmark_id}"
-                    except requests.exceptions.RequestException as text_e:
+                    except http_client.RequestError as text_e:
                         #print(f"Text error response: {text_e.response.text if hasattr(text_e.response, 'text') else text_e}")
                         return f"Error adding as text: {text_e}"
             except json.JSONDecodeError:
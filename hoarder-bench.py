@@ -0,0 +1,208 @@
+import io
+import os
+import sys
+import ast
+import json
+import time
+import shutil
+import tempfile
+import subprocess
+from pathlib import Path
+from urllib.parse import quote
+from urllib3.response import HTTPResponse
+import http_client
+from bundle import BUNDLE_PATH
+from config import HORADER_API_URL, HOARDER_SEARCH_API_URL, HOARDER_TAGS_API_URL, HEADERS
+
+# Requests per endpoint and encoding; the median is reported
+TRANSFER_RUNS = 5
+# Cold starts per script; the median is reported
+IMPORT_RUNS = 5
+# Script filters timed by the imports benchmark, with the query they run
+IMPORT_SCRIPTS = (
+    ("hoarder.py", ""),
+    ("show-tags.py", ""),
+    ("link-info.py", ""),
+    ("actions.py", ""),
+)
+# Scripts whose import phase is compared with and without bundle.zip
+BUNDLE_SCRIPTS = (
+    "hoarder.py",
+    "show-tags.py",
+    "show-tag-bookmarks.py",
+    "link-info.py",
+    "actions.py",
+    "hoard.py",
+    "hoarder-cache.py",
+)
+BUNDLE_RUNS = 15
+# Counted when strace is not installed: the file system calls Python raises audit events for
+AUDITED_CALLS = ("open", "os.listdir", "os.scandir")
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+def endpoints():
+    """(name, url) of the read endpoints the script filters use"""
+    session = http_client.get_session()
+    recent = session.get(HORADER_API_URL, headers=HEADERS, params={"limit": 20}, timeout=30).json().get("bookmarks", [])
+    tags = session.get(HOARDER_TAGS_API_URL, headers=HEADERS, timeout=30).json().get("tags", [])
+    search_input = quote(json.dumps({"0": {"json": {"text": "a"}}}))
+
+    urls = [
+        ("recent bookmarks", f"{HORADER_API_URL}?limit=20&page=1"),
+        ("search", f"{HOARDER_SEARCH_API_URL}?batch=1&input={search_input}"),
+        ("tags", HOARDER_TAGS_API_URL),
+    ]
+    if tags:
+        urls.append(("tag bookmarks", f"{HOARDER_TAGS_API_URL}/{tags[0]['id']}/bookmarks?limit=50&includeContent=true"))
+    if recent:
+        urls.append(("bookmark details", f"{HORADER_API_URL}/{recent[0]['id']}"))
+    return urls
+
+def measure_transfer(url, encoding):
+    """Bytes on the wire, transfer time, decode time and JSON parse time of one GET"""
+    started = time.perf_counter()
+    response = http_client.get_session().get(
+        url, headers=dict(HEADERS, **{"Accept-Encoding": encoding}), stream=True, timeout=30
+    )
+    response.raise_for_status()
+    wire = response.raw.read(decode_content=False)
+    transferred = time.perf_counter() - started
+    content_encoding = response.headers.get("Content-Encoding", "identity")
+
+    # the same incremental decoder requests uses while a body streams in
+    started = time.perf_counter()
+    body = HTTPResponse(
+        body=io.BytesIO(wire),
+        headers={"content-encoding": content_encoding},
+        preload_content=False,
+        decode_content=True
+    ).read()
+    decoded = time.perf_counter() - started
+
+    started = time.perf_counter()
+    json.loads(body)
+    parsed = time.perf_counter() - started
+    return content_encoding, len(wire), len(body), transferred, decoded, parsed
+
+def transfer():
+    """Compare the content codings the server offers, per endpoint"""
+    encodings = ["identity"] + [item.split(";")[0] for item in http_client.accept_encoding().split(", ")]
+    print(f"{'endpoint':<18} {'asked':<9} {'got':<9} {'wire KB':>9} {'body KB':>9} {'fetch ms':>9} {'decode ms':>10} {'json ms':>8}")
+    for name, url in endpoints():
+        for encoding in encodings:
+            runs = [measure_transfer(url, encoding) for _ in range(TRANSFER_RUNS)]
+            got, wire, body = runs[-1][:3]
+            print(
+                f"{name:<18} {encoding:<9} {got:<9} {wire / 1024:>9.1f} {body / 1024:>9.1f} "
+                f"{median(r[3] for r in runs) * 1000:>9.1f} {median(r[4] for r in runs) * 1000:>10.2f} "
+                f"{median(r[5] for r in runs) * 1000:>8.2f}"
+            )
+
+def import_times(code):
+    """Run code in a fresh interpreter with -X importtime; returns (wall ms, {top-level module: cumulative us}, all modules)"""
+    env = dict(os.environ, PYTHONPATH="./libs/", HOARDER_DAEMON="0")
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True
+    )
+    wall = (time.perf_counter() - started) * 1000
+    modules, loaded = {}, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        loaded.add(name.strip())
+        # nested imports are indented under the module that triggered them
+        if not name.startswith("  ") and cumulative.strip().isdigit():
+            modules[name.strip()] = int(cumulative)
+    return wall, modules, loaded
+
+def imports():
+    """Cold-start import cost of the script filters, against importing requests alone"""
+    cases = [
+        ("import requests", "import requests"),
+        # what actions, uploads and icon downloads pay before their first request
+        ("requests session", "import http_client; http_client.get_session()"),
+    ]
+    cases += [
+        (f"{script} {query!r}", f"import sys, runpy; sys.argv = [{script!r}, {query!r}]; runpy.run_path({script!r}, run_name='__main__')")
+        for script, query in IMPORT_SCRIPTS
+    ]
+    for name, code in cases:
+        runs = [import_times(code) for _ in range(IMPORT_RUNS)]
+        wall = median(run[0] for run in runs)
+        modules, loaded = runs[-1][1], runs[-1][2]
+        print(f"{name}: {wall:.1f} ms wall, {sum(modules.values()) / 1000:.1f} ms importing, requests loaded: {'requests' in loaded}")
+        for module, cumulative in sorted(modules.items(), key=lambda item: -item[1])[:5]:
+            print(f"    {module:<24} {cumulative / 1000:>7.1f} ms")
+
+def import_phase(script):
+    """The top-level import statements of a script, as code to run on their own"""
+    tree = ast.parse(Path(script).read_text())
+    body = [
+        node for node in tree.body
+        if isinstance(node, (ast.Import, ast.ImportFrom))
+        or (isinstance(node, ast.Expr) and ast.unparse(node) == "bundle.install()")
+    ]
+    return ast.unparse(ast.Module(body=body, type_ignores=[]))
+
+def file_syscalls(code, env):
+    """File system calls of one run, from strace if installed, otherwise from audit events"""
+    if shutil.which("strace"):
+        with tempfile.NamedTemporaryFile("r") as summary:
+            subprocess.run(
+                ["strace", "-f", "-c", "-e", "trace=%file,getdents64", "-o", summary.name, sys.executable, "-c", code],
+                env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            total = [line for line in summary.read().splitlines() if line.endswith(" total")]
+        return int(total[-1].split()[3]) if total else 0
+
+    with tempfile.NamedTemporaryFile("r") as count:
+        hook = (
+            "import sys, atexit\n"
+            "_calls = [0]\n"
+            f"sys.addaudithook(lambda event, args: _calls.__setitem__(0, _calls[0] + (event in {AUDITED_CALLS!r})))\n"
+            f"atexit.register(lambda: open({count.name!r}, 'w').write(str(_calls[0])))\n"
+        )
+        subprocess.run([sys.executable, "-c", hook + code], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return int(count.read() or 0)
+
+def bundle():
+    """Import phase of each script with and without bundle.zip: file system calls and wall time"""
+    if not os.path.exists(BUNDLE_PATH):
+        print("bundle.zip not found; run python3 build-bundle.py first")
+        sys.exit(1)
+    counter = "strace file syscalls" if shutil.which("strace") else f"{'/'.join(AUDITED_CALLS)} calls"
+    print(f"{'script':<22} {'calls':>7} {'bundled':>8} {'ms':>7} {'bundled':>8}   ({counter}, median ms of {BUNDLE_RUNS} runs)")
+    cases = [(script, import_phase(script)) for script in BUNDLE_SCRIPTS]
+    cases.append(("requests session", "import bundle\nbundle.install()\nimport http_client\nhttp_client.get_session()"))
+    for name, code in cases:
+        results = []
+        for enabled in ("0", "1"):
+            env = dict(os.environ, PYTHONPATH="./libs/", HOARDER_DAEMON="0", HOARDER_BUNDLE=enabled)
+            walls = []
+            for _ in range(BUNDLE_RUNS):
+                started = time.perf_counter()
+                subprocess.run([sys.executable, "-c", code], env=env, stdout=subprocess.DEVNULL)
+                walls.append((time.perf_counter() - started) * 1000)
+            results.append((file_syscalls(code, env), median(walls)))
+        (calls, wall), (bundled_calls, bundled_wall) = results
+        print(f"{name:<22} {calls:>7} {bundled_calls:>8} {wall:>7.1f} {bundled_wall:>8.1f}")
+
+BENCHMARKS = {
+    "transfer": transfer,
+    "imports": imports,
+    "bundle": bundle,
+}
+
+if __name__ == "__main__":
+    # python3 hoarder-bench.py transfer|imports|bundle
+    name = sys.argv[1] if len(sys.argv) > 1 else ""
+    if name not in BENCHMARKS:
+        print(f"Usage: python3 hoarder-bench.py [{'|'.join(BENCHMARKS)}]")
+        sys.exit(1)
+    BENCHMARKS[name]()
@@ -1,123 +1,84 @@
-import requests
-import json
-import sys
-import os
-import hashlib
-from pathlib import Path
-from urllib.parse import urlparse, quote
-from hoarder import CACHE_DIR, HOARDER_SERVER_ADDR, HORADER_API_URL, HOARDER_SEARCH_API_URL, HEADERS
-from hoarder import ensure_cache_dir
+import bundle
+bundle.install()
+import timings
+import profiling
 
-def download_favicon(favicon_url):
-    """Download favicon and return local path"""
-    if not favicon_url:
-        return "icon.png"
-    
-    # use md5 as file name
-    favicon_hash = hashlib.md5(favicon_url.encode()).hexdigest()
-    file_extension = Path(urlparse(favicon_url).path).suffix or '.ico'
-    cache_path = CACHE_DIR / f"{favicon_hash}{file_extension}"
+if __name__ == "__main__":
+    timings.start(__file__)
+    profiling.start(__file__)
 
-    # if cache exists and is not empty, return it
-    if cache_path.exists() and cache_path.stat().st_size > 0:
-        return str(cache_path)
-    
-    # download favicon
-    try:
-        response = requests.get(favicon_url, timeout=5)
-        response.raise_for_status()
-        with open(cache_path, 'wb') as f:
-            f.write(response.content)
-        return str(cache_path)
-    except Exception as e:
-        print(f"Error downloading favicon: {e}", file=sys.stderr)
-        return "icon.png"
+import sys
+import sqlite3
+import background
+import bookmark_store
+import result_cache
+from icon_cache import SPOOL_WAIT, prefetch_icons, take_spooled_bookmarks, collect_garbage, favicon_key, thumbnail_key
+from hoarder import LOCAL_MIRROR, ensure_cache_dir, use_local_mirror
 
-def download_thumbnail(asset_id):
-    """Download and cache thumbnail for image assets"""
-    if not asset_id:
-        return "icon.png"
-    
-    cache_path = CACHE_DIR / f"thumb_{asset_id}.png"
-    
-    if cache_path.exists() and cache_path.stat().st_size > 0:
-        return str(cache_path)
-    
-    try:
-        thumbnail_url = f"{HOARDER_SERVER_ADDR}/api/assets/{asset_id}"
-        response = requests.get(thumbnail_url, headers=HEADERS, timeout=5)
-        response.raise_for_status()
-        with open(cache_path, 'wb') as f:
-            f.write(response.content)
-        return str(cache_path)
-    except Exception as e:
-        return "icon.png"
+timings.mark("imports")
 
-def fetch_bookmarks_icon():
-    try:
-        # add pagination params
-        params = {
-            'limit': 20,  # or larger number
-            'page': 1      # or use offset: 0
-        }
+def prefetch_list_icons(query=""):
+    """
+    Prefetch the icons of the list hoarder.py shows for a query.
 
-        ensure_cache_dir()
-        
-        response = requests.get(HORADER_API_URL, headers=HEADERS, params=params)
-        response.raise_for_status()
-        data = response.json()
-   
-        bookmarks = data.get("bookmarks", [])
-        for bookmark in bookmarks:
-            download_icon_and_thumbnail(bookmark)
+    hoarder.py spools the list it rendered, so no request is made for it here.
+    The spool is only waited for when there is no cached result or local mirror
+    to fall back on: a run the daemon answered from its memo spools nothing.
+    """
+    ensure_cache_dir()
+    key = result_cache.cache_key("search" if query else "recent", query)
+    cached = result_cache.get(key)
+    mirrored = cached is None and use_local_mirror()
+    bookmarks = take_spooled_bookmarks(key, wait=0 if cached is not None or mirrored else SPOOL_WAIT)
+    if bookmarks is None:
+        if cached is not None:
+            bookmarks = cached[0]
+        elif mirrored:
+            bookmarks = bookmark_store.search_bookmarks(query) if query else bookmark_store.recent_bookmarks(20)
+    if bookmarks:
+        prefetch_icons(bookmarks)
 
-    except requests.exceptions.RequestException as e:
-        sys.exit(1)
+def sync_local_mirror():
+    """
+    Refresh the local bookmark mirror when it is enabled and due. The sync
+    runs in the detached background worker, as Alfred stops this script
+    filter on the next keystroke.
+    """
+    if not LOCAL_MIRROR:
+        return
+    try:
+        due = bookmark_store.sync_due()
+    except sqlite3.Error as e:
+        print(f"Error checking the bookmark mirror: {e}", file=sys.stderr)
+        return
+    if due is not None:
+        background.submit("bookmark_store", "sync_if_stale")
+        background.start()
 
-def download_icon_and_thumbnail(bookmark):
-    """Get appropriate arg and icon path based on content type"""
-    content = bookmark.get("content", {})
-    content_type = content.get("type")
-    
-    if content_type == "text" or content_type == "asset":
-        download_thumbnail(content.get("assetId"))
-    else:
-        download_favicon(content.get("favicon"))
+def referenced_icon_keys():
+    """Icon keys of all bookmarks, known only once the local mirror had a full sync"""
+    if not LOCAL_MIRROR or bookmark_store.get_state("last_full_sync") is None:
+        return None
+    keys = set()
+    for favicon, asset_id in bookmark_store.icon_references():
+        if favicon:
+            keys.add(favicon_key(favicon))
+        if asset_id:
+            keys.add(thumbnail_key(asset_id))
+    return keys
 
-def search_bookmarks_icon(query=""):
+def clean_icon_cache():
     try:
-        ensure_cache_dir()
-        
-        # Construct the search payload
-        search_input = {
-            "0": {
-                "json": {
-                    "text": query
-                }
-            }
-        }
-        
-        encoded_input = quote(json.dumps(search_input))
-        search_url = f"{HOARDER_SEARCH_API_URL}?batch=1&input={encoded_input}"
-        
-        response = requests.get(search_url, headers=HEADERS)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Extract bookmarks from the search response
-        bookmarks = data[0]["result"]["data"]["json"]["bookmarks"] if data else []
-        
-        for bookmark in bookmarks:
-            download_icon_and_thumbnail(bookmark)
-
-    except requests.exceptions.RequestException as e:
-        print(e, file=sys.stderr)
-        sys.exit(1)
+        collect_garbage(referenced_icon_keys())
+    except (OSError, sqlite3.Error) as e:
+        print(f"Error cleaning icon cache: {e}", file=sys.stderr)
 
 if __name__ == "__main__":
     # Get search query from command line argument if provided
     query = sys.argv[1] if len(sys.argv) > 1 else ""
-    if not query:
-        fetch_bookmarks_icon()
-        sys.exit(0)
-    search_bookmarks_icon(query)
+    with timings.phase("icon_prefetch"):
+        prefetch_list_icons(query)
+    with timings.phase("sync"):
+        sync_local_mirror()
+    with timings.phase("icon_gc"):
+        clean_icon_cache()
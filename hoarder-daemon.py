@@ -0,0 +1,205 @@
+import bundle
+bundle.install()
+import io
+import os
+import sys
+import json
+import time
+import fcntl
+import select
+import socket
+import contextlib
+import daemon_client
+import timings
+import profiling
+from config import CACHE_DIR, DAEMON_IDLE_TIMEOUT, DAEMON_MEMO_TTL, ensure_cache_dir
+
+# Imported once here so every request runs with warm modules
+import lazy_imports
+lazy_imports.install()
+import requests
+import http_client
+import bookmark_store
+import result_cache
+import hoarder
+
+LOCK_PATH = CACHE_DIR / "daemon.lock"
+# Clients send their request right after connecting
+REQUEST_TIMEOUT = 5
+# Script filters served in-process, and whether identical requests may reuse recent output
+SCRIPTS = {
+    "hoarder.py": True,
+    "show-tags.py": True,
+    "show-tag-bookmarks.py": True,
+    "link-info.py": False,
+}
+
+_compiled = {}
+_recent = {}
+
+def compile_script(name):
+    """Compile a workflow script once, recompiling if the file changed"""
+    path = daemon_client.WORKFLOW_DIR / name
+    mtime = path.stat().st_mtime
+    cached = _compiled.get(name)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, compile(path.read_text(), str(path), "exec"))
+        _compiled[name] = cached
+    return path, cached[1]
+
+def run_script(name, argv, env):
+    """
+    Run a script as __main__ with the client's argv and environment, capturing its output.
+
+    This swaps the process-wide sys.argv, os.environ and sys.stdout/stderr, which is
+    only safe because serve() runs one request at a time; do not call it from threads.
+    """
+    path, code = compile_script(name)
+    stdout, stderr = io.StringIO(), io.StringIO()
+    saved_argv, saved_env = sys.argv, dict(os.environ)
+    sys.argv = [str(path)] + argv
+    os.environ.clear()
+    os.environ.update(env)
+    exit_code = 0
+    try:
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            exec(code, {"__name__": "__main__", "__file__": str(path), "__builtins__": __builtins__})
+    except SystemExit as e:
+        exit_code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+    except Exception as e:
+        print(f"Error in {name}: {e!r}", file=stderr)
+        exit_code = 1
+    finally:
+        timings.finish()
+        profiling.finish()
+        sys.argv = saved_argv
+        os.environ.clear()
+        os.environ.update(saved_env)
+    return {"status": "ok", "exit_code": exit_code, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+def handle(request):
+    name = request.get("script")
+    if request.get("command") == "stop":
+        return {"status": "stopping"}
+    if request.get("settings") != daemon_client.settings_fingerprint(os.environ):
+        return {"status": "settings_changed"}
+    if name not in SCRIPTS:
+        return {"status": "unknown_script"}
+
+    key = json.dumps([name, request.get("argv", []), request.get("env", {})], sort_keys=True)
+    memo = _recent.get(key)
+    # output is reused only while no action, sync or refresh changed the bookmarks
+    if SCRIPTS[name] and memo and time.monotonic() - memo[0] < DAEMON_MEMO_TTL and memo[1] == result_cache.generation():
+        return memo[2]
+
+    reply = run_script(name, request.get("argv", []), request.get("env", {}))
+    if SCRIPTS[name] and reply["exit_code"] == 0:
+        _recent[key] = (time.monotonic(), result_cache.generation(), reply)
+    # keep only fresh entries
+    now = time.monotonic()
+    for stale in [k for k, (at, _, _) in _recent.items() if now - at >= DAEMON_MEMO_TTL]:
+        del _recent[stale]
+    return reply
+
+def read_request(connection):
+    connection.settimeout(REQUEST_TIMEOUT)
+    try:
+        with connection.makefile("rb") as reader:
+            return json.loads(reader.readline())
+    except (OSError, ValueError):
+        return None
+
+def accept_waiting(server):
+    """Connections already queued in the listen backlog, without waiting for more"""
+    waiting = []
+    server.setblocking(False)
+    try:
+        while True:
+            try:
+                waiting.append(server.accept()[0])
+            except BlockingIOError:
+                break
+    finally:
+        server.settimeout(DAEMON_IDLE_TIMEOUT)
+    return waiting
+
+def client_gone(connection):
+    """Whether the client hung up while its request was queued, e.g. Alfred killed it"""
+    readable, _, _ = select.select([connection], [], [], 0)
+    if not readable:
+        return False
+    try:
+        return connection.recv(1, socket.MSG_PEEK) == b""
+    except OSError:
+        return True
+
+def superseded(request, pending):
+    """Whether a newer queued request for the same script makes this one's output moot"""
+    name = request.get("script")
+    return name is not None and any(later.get("script") == name for _, later in pending)
+
+def serve(server):
+    """
+    Serve one request at a time. Requests queue up while a script runs, so
+    before running the next one, skip it if its client has gone away or if a
+    newer request for the same script (a later keystroke) is waiting.
+    """
+    server.settimeout(DAEMON_IDLE_TIMEOUT)
+    pending = []
+    while True:
+        if not pending:
+            try:
+                connection, _ = server.accept()
+            except socket.timeout:
+                return
+            pending.append((connection, read_request(connection)))
+        pending += [(connection, read_request(connection)) for connection in accept_waiting(server)]
+        connection, request = pending.pop(0)
+        with connection:
+            if request is None or client_gone(connection):
+                continue
+            if superseded(request, pending):
+                reply = {"status": "superseded"}
+            else:
+                reply = handle(request)
+            try:
+                connection.sendall(json.dumps(reply).encode() + b"\n")
+            except OSError:
+                pass
+        if reply["status"] in ("stopping", "settings_changed"):
+            for connection, _ in pending:
+                connection.close()
+            return
+
+def main():
+    ensure_cache_dir()
+    with open(LOCK_PATH, "w") as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return  # another daemon is already running
+
+        socket_path = str(daemon_client.SOCKET_PATH)
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(socket_path)
+        daemon_client.IN_DAEMON = True
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as server:
+            old_umask = os.umask(0o177)
+            try:
+                server.bind(socket_path)
+            finally:
+                os.umask(old_umask)
+            server.listen(8)
+            try:
+                serve(server)
+            finally:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(socket_path)
+
+if __name__ == "__main__":
+    # python3 hoarder-daemon.py [stop]
+    if sys.argv[1:] == ["stop"]:
+        with contextlib.suppress(OSError):
+            daemon_client.send_request({"command": "stop"})
+        sys.exit(0)
+    main()
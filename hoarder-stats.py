@@ -0,0 +1,60 @@
+import sys
+import json
+from timings import TRACE_LOG_PATH, TRACE_LOG_BACKUPS
+
+PERCENTILES = (50, 95, 99)
+
+def read_traces():
+    """Trace records from the log and its rotated copies, oldest first"""
+    paths = [TRACE_LOG_PATH.with_name(f"{TRACE_LOG_PATH.name}.{number}") for number in range(TRACE_LOG_BACKUPS, 0, -1)]
+    records = []
+    for path in paths + [TRACE_LOG_PATH]:
+        try:
+            lines = path.read_text().splitlines()
+        except FileNotFoundError:
+            continue
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue  # cut short by a crash or a concurrent rotation
+    return records
+
+def percentile(values, p):
+    """Nearest-rank percentile of sorted values"""
+    rank = max(1, -(-len(values) * p // 100))
+    return values[rank - 1]
+
+def group_phases(records, script=None):
+    """{script: {phase: sorted milliseconds}}, with daemon-served runs listed separately"""
+    groups = {}
+    for record in records:
+        name = record.get("script", "?") + (" (daemon)" if record.get("daemon") else "")
+        if script and record.get("script") != script:
+            continue
+        phases = groups.setdefault(name, {})
+        for phase, milliseconds in record.get("phases", {}).items():
+            phases.setdefault(phase, []).append(milliseconds)
+    for phases in groups.values():
+        for values in phases.values():
+            values.sort()
+    return groups
+
+def print_stats(groups):
+    for name, phases in sorted(groups.items()):
+        runs = len(phases.get("total", []))
+        print(f"{name} ({runs} runs)")
+        print(f"  {'phase':<14} {'count':>6} " + " ".join(f"{'p' + str(p):>9}" for p in PERCENTILES))
+        # phases in first-recorded order, total last
+        for phase in sorted(phases, key=lambda phase: phase == "total"):
+            values = phases[phase]
+            print(f"  {phase:<14} {len(values):>6} " + " ".join(f"{percentile(values, p):>9.1f}" for p in PERCENTILES))
+        print()
+
+if __name__ == "__main__":
+    # python3 hoarder-stats.py [script]: percentiles in ms of the phases traced with HOARDER_TRACE=1
+    records = read_traces()
+    if not records:
+        print(f"No traces in {TRACE_LOG_PATH}; set HOARDER_TRACE to 1 in the workflow configuration")
+        sys.exit(1)
+    print_stats(group_phases(records, sys.argv[1] if len(sys.argv) > 1 else None))
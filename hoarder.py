@@ -1,191 +1,172 @@
-import requests
-import json
+import bundle
+bundle.install()
 import sys
+import daemon_client
+import timings
+import profiling
+
+# Hand the invocation to the hoarder daemon before importing the HTTP stack
+if __name__ == "__main__":
+    timings.start(__file__)
+    with timings.phase("daemon"):
+        daemon_client.forward_to_daemon(__file__)
+    profiling.start(__file__)
+
+import http_client
+import json
 import os
-import hashlib
-from pathlib import Path
-from urllib.parse import urlparse, quote
+import sqlite3
+from urllib.parse import quote
+from concurrent.futures import ThreadPoolExecutor, wait
+import bookmark_store
+import result_cache
+import icon_cache
+import background
+from render import bookmark_items, lean_bookmark
+from config import (
+    HORADER_API_URL,
+    HOARDER_SEARCH_API_URL,
+    HEADERS,
+    LOCAL_MIRROR,
+    RESULT_CACHE_TTL,
+    DETAIL_PREFETCH_COUNT,
+    ensure_cache_dir
+)
+
+timings.mark("imports")
 
-# cache at current directory
-CACHE_DIR = Path(__file__).parent / "cache"
-HOARDER_SERVER_ADDR = os.getenv("HOARDER_SERVER_ADDR")
-HORADER_API_URL = f"{HOARDER_SERVER_ADDR}/api/v1/bookmarks"
-HOARDER_SEARCH_API_URL = f"{HOARDER_SERVER_ADDR}/api/trpc/bookmarks.searchBookmarks"
-HOARDER_API_KEY = os.getenv("HOARDER_API_KEY")
-HEADERS = {
-    "Accept": "application/json",
-    "Authorization": f"Bearer {HOARDER_API_KEY}"
-}
-TAGS_SHOWN_COUNT = int(os.getenv("TAGS_SHOWN_COUNT", "0"))
+# Seconds between Alfred reruns while a stale cached result is refreshed
+RESULT_CACHE_RERUN = 0.5
+# Give up waiting for a background refresh after this many reruns
+RESULT_CACHE_MAX_RERUNS = 10
+# Detail requests running at once, and seconds allowed for a whole prefetch run
+DETAIL_PREFETCH_WORKERS = 4
+DETAIL_PREFETCH_DEADLINE = 5
 
-def ensure_cache_dir():
-    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+def use_local_mirror():
+    """Whether list/search views should be answered from the local SQLite mirror"""
+    return LOCAL_MIRROR and bookmark_store.is_synced()
 
-def get_favicon_path(favicon_url):
-    """Download favicon and return local path"""
-    if not favicon_url:
-        return "icon.png"
-    
-    # use md5 as file name
-    favicon_hash = hashlib.md5(favicon_url.encode()).hexdigest()
-    file_extension = Path(urlparse(favicon_url).path).suffix or '.ico'
-    cache_path = CACHE_DIR / f"{favicon_hash}{file_extension}"
+def fetch_recent_bookmarks():
+    """Fetch the most recent bookmarks from the Hoarder server"""
+    # add pagination params
+    params = {
+        'limit': 20,  # or larger number
+        'page': 1,     # or use offset: 0
+        'includeContent': 'false'  # list views never show the page content
+    }
 
-    # if cache exists and is not empty, return it
-    if cache_path.exists() and cache_path.stat().st_size > 0:
-        return str(cache_path)
-    
-    return "icon.png"
-    # download favicon
-    #try:
-    #    response = requests.get(favicon_url, timeout=5)
-    #    response.raise_for_status()
-    #    with open(cache_path, 'wb') as f:
-    #        f.write(response.content)
-    #    return str(cache_path)
-    #except Exception as e:
-    #    print(f"Error downloading favicon: {e}", file=sys.stderr)
-    #    return "icon.png"
+    response = http_client.get(HORADER_API_URL, headers=HEADERS, params=params)
+    response.raise_for_status()
+    return response.json().get("bookmarks", [])
 
-def get_thumbnail_path(asset_id):
-    """Download and cache thumbnail for image assets"""
-    if not asset_id:
-        return "icon.png"
-    
-    cache_path = CACHE_DIR / f"thumb_{asset_id}.png"
-    
-    if cache_path.exists() and cache_path.stat().st_size > 0:
-        return str(cache_path)
-    
-    return "icon.png"
-    #try:
-    #    thumbnail_url = f"{HOARDER_SERVER_ADDR}/api/assets/{asset_id}"
-    #    response = requests.get(thumbnail_url, headers=HEADERS, timeout=5)
-    #    response.raise_for_status()
-    #    with open(cache_path, 'wb') as f:
-    #        f.write(response.content)
-    #    return str(cache_path)
-    #except Exception as e:
-    #    print(f"Error downloading thumbnail: {e}", file=sys.stderr)
-    #    return "icon.png"
+def fetch_from_server(query):
+    """Fetch a list or search result, keeping only the fields the list view renders"""
+    bookmarks = fetch_search_results(query) if query else fetch_recent_bookmarks()
+    return [lean_bookmark(bookmark) for bookmark in bookmarks]
 
-def format_title_with_tags(bookmark):
-    """Format title with tags based on TAGS_SHOWN_COUNT"""
-    content = bookmark.get("content", {})
-    content_type = content.get("type")
-    
-    if content_type == "asset" and content.get("assetType") == "image":
-        title = content.get("fileName", "Untitled Image")
-    else:
-        title = (bookmark.get("content", {}).get("title") or 
-                bookmark.get("title") or 
-                "Untitled")
-    
-    if TAGS_SHOWN_COUNT > 0:
-        tags = bookmark.get("tags", [])
-        if tags:
-            shown_tags = tags[:TAGS_SHOWN_COUNT]
-            tags_string = " " + ", ".join(f"#{tag.get('name', '')}" for tag in shown_tags if tag.get('name'))
-            title = f"{title}{tags_string}"
-    
-    return title
+def refresh_cached_query(query):
+    key = result_cache.cache_key("search" if query else "recent", query)
+    try:
+        result_cache.put(key, fetch_from_server(query))
+    except (http_client.RequestError, ValueError, KeyError, sqlite3.Error) as e:
+        print(f"Error refreshing cached results: {e!r}", file=sys.stderr)
+    finally:
+        # put() releases it too; this also covers failures, so the next rerun can retry
+        try:
+            result_cache.release_refresh(key)
+        except sqlite3.Error:
+            pass
 
-def format_title_without_tags(bookmark):
-    content = bookmark.get("content", {})
-    content_type = content.get("type")
-    
-    if content_type == "asset" and content.get("assetType") == "image":
-        title = content.get("fileName", "Untitled Image")
-    else:
-        title = (bookmark.get("content", {}).get("title") or 
-                bookmark.get("title") or 
-                "Untitled")
-    return title
+def load_bookmarks(query=""):
+    """
+    Return the bookmarks for a list (empty query) or search view, plus extra
+    top-level keys for the Alfred feedback.
 
-def get_arg_and_icon(bookmark):
-    """Get appropriate arg and icon path based on content type"""
-    content = bookmark.get("content", {})
-    content_type = content.get("type")
-    
-    if content_type == "text" or content_type == "asset":
-        #arg = bookmark.get("id", "")
-        arg = HOARDER_SERVER_ADDR + "/dashboard/preview/" + bookmark.get("id", "")
-        icon_path = ("icon.png" if content_type == "text" else 
-                    get_thumbnail_path(content.get("assetId")))
-    else:
-        arg = content.get("url", "")
-        icon_path = get_favicon_path(content.get("favicon"))
-    
-    return arg, icon_path
+    Cached results are shown at once. When they are older than RESULT_CACHE_TTL
+    they are refreshed in the background and Alfred reruns the script filter to
+    pick up the fresh result.
+    """
+    if use_local_mirror():
+        if query:
+            return bookmark_store.search_bookmarks(query), {}
+        return bookmark_store.recent_bookmarks(20), {}
 
-def fetch_bookmarks():
+    key = result_cache.cache_key("search" if query else "recent", query)
+    cached = result_cache.get(key)
+    if cached is None:
+        bookmarks = fetch_from_server(query)
+        result_cache.put(key, bookmarks)
+        return bookmarks, {}
+
+    bookmarks, age = cached
+    if age <= RESULT_CACHE_TTL:
+        return bookmarks, {}
+
+    if result_cache.claim_refresh(key):
+        background.submit("hoarder", "refresh_cached_query", query)
+    # variables persist for the whole Alfred session, so only count reruns of this query
+    reruns = int(os.getenv("result_cache_reruns", "0")) if os.getenv("result_cache_key") == key else 0
+    if reruns >= RESULT_CACHE_MAX_RERUNS:
+        return bookmarks, {}
+    return bookmarks, {
+        "rerun": RESULT_CACHE_RERUN,
+        "variables": {"result_cache_key": key, "result_cache_reruns": str(reruns + 1)}
+    }
+
+def fetch_bookmark(bookmark_id):
+    response = http_client.get(f"{HORADER_API_URL}/{bookmark_id}", headers=HEADERS, timeout=DETAIL_PREFETCH_DEADLINE)
+    response.raise_for_status()
+    return lean_bookmark(response.json())
+
+def prefetch_details(bookmark_ids):
+    """Cache the details of bookmarks likely to be opened next, for link-info.py"""
+    executor = ThreadPoolExecutor(max_workers=DETAIL_PREFETCH_WORKERS)
     try:
-        # add pagination params
-        params = {
-            'limit': 20,  # or larger number
-            'page': 1      # or use offset: 0
-        }
+        futures = [executor.submit(fetch_bookmark, bookmark_id) for bookmark_id in bookmark_ids]
+        done, _ = wait(futures, timeout=DETAIL_PREFETCH_DEADLINE)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    for future in done:
+        if future.exception() is None:
+            result_cache.put_details(future.result())
+
+def submit_detail_prefetch(bookmarks):
+    """Queue a details prefetch for the top results that are not cached yet"""
+    bookmark_ids = []
+    for bookmark in bookmarks[:DETAIL_PREFETCH_COUNT]:
+        cached = result_cache.get_details(bookmark.get("id"))
+        if cached is None or cached[1] > RESULT_CACHE_TTL:
+            bookmark_ids.append(bookmark.get("id"))
+    if bookmark_ids:
+        background.submit("hoarder", "prefetch_details", bookmark_ids)
+
+def spool_for_icons(query, bookmarks):
+    """Hand a rendered list to hoarder-cache.py, which prefetches its icons instead of fetching it again"""
+    try:
+        icon_cache.spool_bookmarks(result_cache.cache_key("search" if query else "recent", query), bookmarks)
+    except OSError as e:
+        print(f"Error spooling bookmarks: {e}", file=sys.stderr)
 
+def fetch_bookmarks():
+    try:
         ensure_cache_dir()
-        
-        response = requests.get(HORADER_API_URL, headers=HEADERS, params=params)
-        response.raise_for_status()
-        data = response.json()
-        # print actual data structure
-        #print("DEBUG: API Response:", json.dumps(data, indent=2), file=sys.stderr)        
-        # print response headers
-        #print("DEBUG Headers:", dict(response.headers), file=sys.stderr)
-        #print("DEBUG Total bookmarks:", len(data.get("bookmarks", [])), file=sys.stderr)
-        
-        # DEBUG; get data directly, not use .get("bookmarks")
-        #bookmarks = data if isinstance(data, list) else data.get("bookmarks", [])        
-        bookmarks = data.get("bookmarks", [])
-        
+
+        bookmarks, extra = load_bookmarks()
+
         # Format bookmarks for Alfred feedback
         alfred_feedback = {
-            "items": [
-                {
-                    "title": format_title_with_tags(bookmark),
-                    "subtitle": (bookmark.get("content", {}).get("url", "") or 
-                               bookmark.get("content", {}).get("text", "") or 
-                               bookmark.get("content", {}).get("fileName", "")),
-                    "arg": get_arg_and_icon(bookmark)[0],
-                    "mods": {
-                        "ctrl": {
-                            "arg": bookmark.get("id", "")
-                        },
-                        "cmd": {
-                            "arg": get_arg_and_icon(bookmark)[0],
-                        },
-                        "option": {
-                            "arg": f"{HOARDER_SERVER_ADDR}/dashboard/preview/{bookmark.get('id', '')}"
-                        },
-                        "shift": {
-                            "arg": f"[{format_title_without_tags(bookmark)}]({get_arg_and_icon(bookmark)[0]})"
-                        }
-                    },
-                    "icon": {
-                        "path": get_arg_and_icon(bookmark)[1]
-                    },
-                    "quicklookurl": bookmark.get("content", {}).get("url"),
-                    # create match text, include title, url, description and html content and tags
-                    #"match": " ".join(filter(None, [
-                    #    bookmark.get("content", {}).get("title", ""),
-                    #    bookmark.get("content", {}).get("url", ""),
-                    #    bookmark.get("content", {}).get("description", ""),
-                    #    bookmark.get("content", {}).get("htmlContent", ""),
-                    #    bookmark.get("note", ""),
-                    #    bookmark.get("summary", ""),
-                    #    # join tags with space
-                    #    " ".join(tag.get("name", "") for tag in bookmark.get("tags", []))
-                    #])).replace('/', ' ').replace('-', ' ').replace('_', ' ')
-                } for bookmark in bookmarks
-            ]
+            "items": bookmark_items(bookmarks)
         }
+        alfred_feedback.update(extra)
         
         print(json.dumps(alfred_feedback))
+        background.finish_output()
+        spool_for_icons("", bookmarks)
+        submit_detail_prefetch(bookmarks)
+        background.start()
 
-    except requests.exceptions.RequestException as e:
+    except http_client.RequestError as e:
         print(json.dumps({
             "items": [
                 {
@@ -199,63 +180,46 @@ def fetch_bookmarks():
         }))
         sys.exit(1)
 
+def fetch_search_results(query):
+    """Run a full text search on the Hoarder server"""
+    # Construct the search payload
+    search_input = {
+        "0": {
+            "json": {
+                "text": query
+            }
+        }
+    }
+
+    encoded_input = quote(json.dumps(search_input))
+    search_url = f"{HOARDER_SEARCH_API_URL}?batch=1&input={encoded_input}"
+
+    response = http_client.get(search_url, revalidate=False, headers=HEADERS)
+    response.raise_for_status()
+    data = response.json()
+
+    # Extract bookmarks from the search response
+    return data[0]["result"]["data"]["json"]["bookmarks"] if data else []
+
 def search_bookmarks(query=""):
     try:
         ensure_cache_dir()
-        
-        # Construct the search payload
-        search_input = {
-            "0": {
-                "json": {
-                    "text": query
-                }
-            }
-        }
-        
-        encoded_input = quote(json.dumps(search_input))
-        search_url = f"{HOARDER_SEARCH_API_URL}?batch=1&input={encoded_input}"
-        
-        response = requests.get(search_url, headers=HEADERS)
-        response.raise_for_status()
-        data = response.json()
-        
-        # Extract bookmarks from the search response
-        bookmarks = data[0]["result"]["data"]["json"]["bookmarks"] if data else []
-        
+
+        bookmarks, extra = load_bookmarks(query)
+
         # Use the same format as fetch_bookmarks
         alfred_feedback = {
-            "items": [
-                {
-                    "title": format_title_with_tags(bookmark),
-                    "subtitle": (bookmark.get("content", {}).get("url", "") or 
-                               bookmark.get("content", {}).get("text", "") or 
-                               bookmark.get("content", {}).get("fileName", "")),
-                    "arg": get_arg_and_icon(bookmark)[0],
-                    "mods": {
-                        "ctrl": {
-                            "arg": bookmark.get("id", "")
-                        },
-                        "option": {
-                            "arg": f"{HOARDER_SERVER_ADDR}/dashboard/preview/{bookmark.get('id', '')}"
-                        },
-                        "cmd": {
-                            "arg": get_arg_and_icon(bookmark)[0],
-                        },
-                        "shift": {
-                            "arg": f"[{format_title_without_tags(bookmark)}]({get_arg_and_icon(bookmark)[0]})"
-                        }
-                    },
-                    "icon": {
-                        "path": get_arg_and_icon(bookmark)[1]
-                    },
-                    "quicklookurl": bookmark.get("content", {}).get("url")
-                } for bookmark in bookmarks
-            ]
+            "items": bookmark_items(bookmarks)
         }
+        alfred_feedback.update(extra)
         
         print(json.dumps(alfred_feedback))
+        background.finish_output()
+        spool_for_icons(query, bookmarks)
+        submit_detail_prefetch(bookmarks)
+        background.start()
 
-    except requests.exceptions.RequestException as e:
+    except http_client.RequestError as e:
         print(json.dumps({
             "items": [
                 {
@@ -0,0 +1,400 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from urllib.parse import urlsplit, urlencode
+import lazy_imports
+import timings
+from config import CACHE_DIR, HOARDER_SERVER_ADDR, ensure_cache_dir
+
+# Connections kept open to the server; details prefetch and actions use several at once
+POOL_MAXSIZE = 8
+# Seconds to connect and to wait for data, for calls that do not pass their own timeout
+DEFAULT_TIMEOUT = (3.05, 15)
+# Connection errors and gateway errors are retried briefly, for idempotent methods only
+RETRY_TOTAL = 2
+RETRY_BACKOFF = 0.2
+RETRY_STATUSES = (502, 503, 504)
+
+# Content codings in order of preference; only those urllib3 can decode here are offered
+ENCODING_PREFERENCE = ("zstd", "br", "gzip", "deflate")
+# Codings the fast path decodes itself with zlib
+FAST_ACCEPT_ENCODING = "gzip, deflate;q=0.9"
+FAST_READ_SIZE = 65536
+USER_AGENT = "alfred-hoarder"
+# CA bundle overrides honoured by requests (and SSL_CERT_FILE by OpenSSL); the fast path only trusts certifi
+CA_BUNDLE_VARIABLES = ("REQUESTS_CA_BUNDLE", "CURL_CA_BUNDLE", "SSL_CERT_FILE")
+
+# Validators and bodies of GET responses, for conditional requests
+VALIDATORS_DB_PATH = CACHE_DIR / "http.db"
+# Stored responses kept (least recently used are evicted), the largest body stored,
+# and the most body bytes stored in total
+VALIDATORS_MAX_ENTRIES = 200
+VALIDATORS_MAX_BODY = 2 * 1024 * 1024
+VALIDATORS_MAX_BYTES = 20 * 1024 * 1024
+
+VALIDATORS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_type TEXT,
+    body BLOB NOT NULL,
+    used_at REAL NOT NULL
+);
+"""
+
+_session = None
+_session_lock = threading.Lock()
+_ssl_context = None
+# whether a proxy applies to an origin, by origin and proxy environment
+_proxied = {}
+# one validator connection and one set of keep-alive connections per thread,
+# as details are prefetched from worker threads
+_local = threading.local()
+
+class RequestError(Exception):
+    """A request that could not be completed, whichever HTTP stack sent it"""
+
+    def __init__(self, message, response=None):
+        super().__init__(message)
+        self.response = response
+
+class HTTPError(RequestError):
+    """A 4xx/5xx response, raised by Response.raise_for_status()"""
+
+class Headers(dict):
+    """Response headers with case-insensitive lookup"""
+
+    def __init__(self, items=()):
+        super().__init__((name.lower(), value) for name, value in items)
+
+    def __getitem__(self, name):
+        return super().__getitem__(name.lower())
+
+    def __setitem__(self, name, value):
+        super().__setitem__(name.lower(), value)
+
+    def __contains__(self, name):
+        return super().__contains__(name.lower())
+
+    def get(self, name, default=None):
+        return super().get(name.lower(), default)
+
+class Response:
+    """The parts of a requests response the workflow uses, returned by both HTTP stacks"""
+
+    def __init__(self, status_code, reason, headers, content, url, from_cache=False):
+        self.status_code = status_code
+        self.reason = reason
+        self.headers = Headers(headers)
+        self.content = content
+        self.url = url
+        self.from_cache = from_cache
+
+    @property
+    def text(self):
+        content_type = self.headers.get("Content-Type", "")
+        charset = "utf-8"
+        if "charset=" in content_type:
+            charset = content_type.split("charset=")[-1].split(";")[0].strip() or charset
+        return self.content.decode(charset, errors="replace")
+
+    def json(self):
+        with timings.phase("json"):
+            return json.loads(self.content)
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            kind = "Client" if self.status_code < 500 else "Server"
+            raise HTTPError(f"{self.status_code} {kind} Error: {self.reason} for url: {self.url}", response=self)
+
+def accept_encoding():
+    """Accept-Encoding header ranking the available decoders, e.g. br, gzip;q=0.9, deflate;q=0.8"""
+    from urllib3.util.request import ACCEPT_ENCODING
+    available = ACCEPT_ENCODING.split(",")
+    offered = [encoding for encoding in ENCODING_PREFERENCE if encoding in available]
+    return ", ".join(encoding if i == 0 else f"{encoding};q={1 - i / 10:.1f}" for i, encoding in enumerate(offered))
+
+def get_session():
+    """
+    Process-wide requests session, imported on first use.
+
+    Reusing one session keeps TCP/TLS connections to the Hoarder server alive
+    between calls, which matters most inside the long-lived hoarder daemon.
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            with timings.phase("session"):
+                _session = new_session()
+    return _session
+
+def new_session():
+    """A requests session with retries; importing requests is most of the cost"""
+    lazy_imports.install()
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    retry = Retry(
+        total=RETRY_TOTAL,
+        backoff_factor=RETRY_BACKOFF,
+        status_forcelist=RETRY_STATUSES,
+        raise_on_status=False
+    )
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=POOL_MAXSIZE, max_retries=retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # bodies are decompressed chunk by chunk as they are read
+    session.headers["Accept-Encoding"] = accept_encoding()
+    return session
+
+def use_fast_path(method, url, kwargs):
+    """Plain GETs to the Hoarder server skip the requests stack"""
+    if method != "GET" or set(kwargs) - {"headers", "timeout"}:
+        return False
+    target, server = urlsplit(url), urlsplit(HOARDER_SERVER_ADDR or "")
+    if target.scheme not in ("http", "https") or (target.scheme, target.netloc) != (server.scheme, server.netloc):
+        return False
+    # custom CA bundles (which only matter for https) and proxies are left to requests
+    if target.scheme == "https" and any(os.environ.get(name) for name in CA_BUNDLE_VARIABLES):
+        return False
+    return not uses_proxy(target)
+
+def uses_proxy(target):
+    """
+    Whether requests would send a request to this origin through a proxy: one
+    from the environment or, on macOS, the system settings.
+
+    The answer is kept for the process (the daemon's lifetime at most), as
+    reading the system settings is slow.
+    """
+    environment = tuple(sorted((name, value) for name, value in os.environ.items() if name.lower().endswith("_proxy")))
+    key = (target.scheme, target.netloc, environment)
+    if key not in _proxied:
+        import urllib.request
+        proxies = urllib.request.getproxies()
+        proxy = proxies.get(target.scheme) or proxies.get("all")
+        _proxied[key] = bool(proxy) and not urllib.request.proxy_bypass(target.hostname or "")
+    return _proxied[key]
+
+def fast_connection(scheme, netloc, connect_timeout):
+    """This thread's keep-alive connection to a server, connecting within connect_timeout"""
+    global _ssl_context
+    import http.client
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    connection = connections.get((scheme, netloc))
+    if connection is None:
+        if scheme == "https":
+            if _ssl_context is None:
+                import ssl
+                import certifi
+                # the CA bundle requests would use
+                _ssl_context = ssl.create_default_context(cafile=certifi.where())
+            connection = http.client.HTTPSConnection(netloc, timeout=connect_timeout, context=_ssl_context)
+        else:
+            connection = http.client.HTTPConnection(netloc, timeout=connect_timeout)
+        connections[(scheme, netloc)] = connection
+    connection.timeout = connect_timeout
+    return connection
+
+def close_fast_connection(scheme, netloc):
+    connection = getattr(_local, "connections", {}).pop((scheme, netloc), None)
+    if connection is not None:
+        connection.close()
+
+def read_body(raw):
+    """Read a response body, decompressing it chunk by chunk"""
+    encoding = (raw.getheader("Content-Encoding") or "identity").strip().lower()
+    if encoding == "gzip":
+        decoder = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    elif encoding == "deflate":
+        decoder = zlib.decompressobj()
+    elif encoding == "identity":
+        decoder = None
+    else:
+        raise ValueError(f"unsupported Content-Encoding {encoding}")
+
+    chunks = []
+    while True:
+        chunk = raw.read(FAST_READ_SIZE)
+        if not chunk:
+            break
+        chunks.append(decoder.decompress(chunk) if decoder else chunk)
+    if decoder:
+        chunks.append(decoder.flush())
+    return b"".join(chunks)
+
+def fast_get(url, headers, timeout):
+    """
+    GET over http.client on a kept-alive connection, retried like the session.
+
+    Returns None for redirects, which are left to requests.
+    """
+    import socket
+    import http.client
+    parts = urlsplit(url)
+    path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    request_headers = {"User-Agent": USER_AGENT, "Accept-Encoding": FAST_ACCEPT_ENCODING}
+    request_headers.update(headers or {})
+    # (connect, read) like requests, or one value for both
+    connect_timeout, read_timeout = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+
+    for attempt in range(RETRY_TOTAL + 1):
+        connection = fast_connection(parts.scheme, parts.netloc, connect_timeout)
+        try:
+            if connection.sock is None:
+                # DNS, TCP and TLS; kept-alive connections skip it
+                with timings.phase("connect"):
+                    connection.connect()
+            connection.sock.settimeout(read_timeout)
+            # from sending the request to the response headers, mostly server time
+            with timings.phase("server"):
+                connection.request("GET", path, headers=request_headers)
+                raw = connection.getresponse()
+            with timings.phase("download"):
+                body = read_body(raw)
+        except (OSError, http.client.HTTPException, ValueError, zlib.error) as e:
+            close_fast_connection(parts.scheme, parts.netloc)
+            # a server that did not answer in time is not asked again
+            if attempt < RETRY_TOTAL and not isinstance(e, socket.timeout):
+                # the first retry is immediate: usually a kept-alive connection the server closed
+                time.sleep(RETRY_BACKOFF * attempt)
+                continue
+            raise RequestError(f"GET {url} failed: {e}") from e
+
+        if raw.will_close:
+            close_fast_connection(parts.scheme, parts.netloc)
+        if raw.status in RETRY_STATUSES and attempt < RETRY_TOTAL:
+            time.sleep(RETRY_BACKOFF * 2 ** attempt)
+            continue
+        if raw.status in (301, 302, 303, 307, 308):
+            return None
+        return Response(raw.status, raw.reason, raw.getheaders(), body, url)
+
+def session_request(method, url, **kwargs):
+    session = get_session()
+    import requests
+    try:
+        with timings.phase("request"):
+            response = session.request(method, url, **kwargs)
+    except requests.exceptions.RequestException as e:
+        raise RequestError(str(e)) from e
+    return Response(response.status_code, response.reason, response.headers.items(), response.content, response.url)
+
+def validators_db():
+    db = getattr(_local, "connection", None)
+    if db is None:
+        ensure_cache_dir()
+        db = sqlite3.connect(str(VALIDATORS_DB_PATH), timeout=5, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(VALIDATORS_SCHEMA)
+        _local.connection = db
+    return db
+
+def response_key(url, headers):
+    """The full URL plus the credentials it was fetched with"""
+    authorization = (headers or {}).get("Authorization", "")
+    return url + " " + hashlib.md5(authorization.encode()).hexdigest()
+
+def stored_response(url, row):
+    """Turn a stored body into a 200 response, as if the server had sent it again"""
+    headers = [("Content-Type", row[2] or "application/json")]
+    if row[0]:
+        headers.append(("ETag", row[0]))
+    if row[1]:
+        headers.append(("Last-Modified", row[1]))
+    return Response(200, "OK", headers, row[3], url, from_cache=True)
+
+def store_response(key, response):
+    etag = response.headers.get("ETag")
+    last_modified = response.headers.get("Last-Modified")
+    if not etag and not last_modified:
+        return
+    if len(response.content) > VALIDATORS_MAX_BODY:
+        return
+    db = validators_db()
+    db.execute(
+        "INSERT OR REPLACE INTO responses (key, etag, last_modified, content_type, body, used_at) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        (key, etag, last_modified, response.headers.get("Content-Type"), response.content, time.time())
+    )
+    db.execute(
+        "DELETE FROM responses WHERE key NOT IN "
+        "(SELECT key FROM responses ORDER BY used_at DESC LIMIT ?)",
+        (VALIDATORS_MAX_ENTRIES,)
+    )
+    db.execute(
+        "DELETE FROM responses WHERE key IN (SELECT key FROM "
+        "(SELECT key, SUM(length(body)) OVER (ORDER BY used_at DESC) AS total FROM responses) WHERE total > ?)",
+        (VALIDATORS_MAX_BYTES,)
+    )
+
+def get(url, revalidate=True, **kwargs):
+    """
+    GET as a conditional request.
+
+    The validators (ETag / Last-Modified) of earlier responses are sent along,
+    and a 304 Not Modified is answered with the stored body, so callers always
+    see a 200 with the full content. Pass revalidate=False for URLs that are
+    rarely requested twice, e.g. searches and cursor pages, so they are not stored.
+    """
+    params = kwargs.pop("params", None)
+    if params:
+        url += ("&" if "?" in url else "?") + urlencode(params, doseq=True)
+    if not revalidate:
+        return request("GET", url, **kwargs)
+    headers = dict(kwargs.pop("headers", None) or {})
+    key = response_key(url, headers)
+
+    try:
+        row = validators_db().execute(
+            "SELECT etag, last_modified, content_type, body FROM responses WHERE key = ?", (key,)
+        ).fetchone()
+    except sqlite3.Error:
+        row = None
+    if row is not None:
+        if row[0]:
+            headers["If-None-Match"] = row[0]
+        if row[1]:
+            headers["If-Modified-Since"] = row[1]
+
+    response = request("GET", url, headers=headers, **kwargs)
+    try:
+        if response.status_code == 304 and row is not None:
+            validators_db().execute("UPDATE responses SET used_at = ? WHERE key = ?", (time.time(), key))
+            return stored_response(url, row)
+        if response.status_code == 200:
+            store_response(key, response)
+    except sqlite3.Error:
+        pass
+    return response
+
+def request(method, url, **kwargs):
+    """
+    Send a request and return a Response; raises RequestError if it fails.
+
+    Plain GETs to the Hoarder server go over http.client, so the script filters
+    never import requests. Everything else uses the pooled requests session.
+    """
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    if use_fast_path(method, url, kwargs):
+        response = fast_get(url, kwargs.get("headers"), kwargs["timeout"])
+        if response is not None:
+            return response
+    return session_request(method, url, **kwargs)
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+def patch(url, **kwargs):
+    return request("PATCH", url, **kwargs)
+
+def delete(url, **kwargs):
+    return request("DELETE", url, **kwargs)
@@ -0,0 +1,475 @@
+import os
+import sys
+import json
+import time
+import fcntl
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+from urllib.parse import urlparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import lazy_imports
+import timings
+from config import (
+    CACHE_DIR,
+    HOARDER_SERVER_ADDR,
+    HEADERS,
+    ICON_CACHE_MAX_MB,
+    ICON_CACHE_MAX_ENTRIES,
+    ensure_cache_dir
+)
+
+# Downloads running at once, in total and against any single host
+PREFETCH_WORKERS = 8
+PER_HOST_CONCURRENCY = 2
+# Seconds allowed for one icon, and for a whole prefetch run
+DOWNLOAD_TIMEOUT = 5
+PREFETCH_DEADLINE = 10
+
+# Failed downloads are not retried for FAILURE_BACKOFF seconds, doubling per failure
+FAILURES_PATH = CACHE_DIR / "icon_failures.json"
+# Held while merging outcomes, so prefetches finishing together do not lose each other's
+FAILURES_LOCK_PATH = CACHE_DIR / "icon_failures.lock"
+FAILURE_BACKOFF = 300
+FAILURE_BACKOFF_MAX = 7 * 86400
+
+# Index of cached icon files, used for LRU eviction and orphan removal
+INDEX_PATH = CACHE_DIR / "icons.db"
+# Files removed or adopted per garbage collection run, and seconds between
+# passes that compare the index with the directory and with the bookmarks
+GC_BATCH = 200
+GC_FULL_INTERVAL = 86400
+# Icons used within this many seconds are never treated as orphans
+ORPHAN_GRACE = 86400
+# Seconds between checks whether another process changed the index
+MANIFEST_CHECK_INTERVAL = 1
+
+# Bookmark lists handed over by hoarder.py, so hoarder-cache.py needs no request of its own.
+# hoarder-cache.py waits up to SPOOL_WAIT seconds for the list; unclaimed ones expire.
+SPOOL_DIR = CACHE_DIR / "icon_spool"
+SPOOL_WAIT = 3
+SPOOL_MAX_AGE = 3600
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS icons (
+    key TEXT PRIMARY KEY,
+    filename TEXT NOT NULL UNIQUE,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS icons_last_used ON icons (last_used);
+CREATE TABLE IF NOT EXISTS gc_state (
+    key TEXT PRIMARY KEY,
+    value REAL
+);
+"""
+
+_failures = None
+_index = None
+_manifest = None
+_manifest_version = None
+_manifest_checked_at = 0
+
+def favicon_cache_path(favicon_url):
+    # use md5 as file name
+    favicon_hash = hashlib.md5(favicon_url.encode()).hexdigest()
+    file_extension = Path(urlparse(favicon_url).path).suffix or '.ico'
+    return CACHE_DIR / f"{favicon_hash}{file_extension}"
+
+def thumbnail_cache_path(asset_id):
+    return CACHE_DIR / f"thumb_{asset_id}.png"
+
+def favicon_key(favicon_url):
+    return f"favicon:{favicon_url}"
+
+def thumbnail_key(asset_id):
+    return f"asset:{asset_id}"
+
+def load_failures():
+    """Negative cache of icon downloads: key -> {"failures": n, "retry_at": timestamp}"""
+    global _failures
+    if _failures is None:
+        try:
+            _failures = json.loads(FAILURES_PATH.read_text())
+        except (OSError, ValueError):
+            _failures = {}
+    return _failures
+
+def is_known_bad(key):
+    """True while a failed icon is still backing off"""
+    entry = load_failures().get(key)
+    return entry is not None and entry["retry_at"] > time.time()
+
+def record_results(failed, succeeded):
+    """Merge download outcomes into the negative cache on disk"""
+    global _failures
+    if not failed and not succeeded:
+        return
+    ensure_cache_dir()
+    with open(FAILURES_LOCK_PATH, "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        _failures = None  # another process may have written in the meantime
+        failures = load_failures()
+        now = time.time()
+        for key in failed:
+            count = failures.get(key, {}).get("failures", 0) + 1
+            backoff = min(FAILURE_BACKOFF * 2 ** (count - 1), FAILURE_BACKOFF_MAX)
+            failures[key] = {"failures": count, "retry_at": now + backoff}
+        for key in succeeded:
+            failures.pop(key, None)
+        # forget icons that have not failed again for a long time
+        for key in [k for k, entry in failures.items() if entry["retry_at"] < now - FAILURE_BACKOFF_MAX]:
+            del failures[key]
+
+        # replaced atomically, so readers that do not lock never see a partial file
+        partial_path = FAILURES_PATH.with_name(f".{FAILURES_PATH.name}.{os.getpid()}")
+        partial_path.write_text(json.dumps(failures))
+        os.replace(partial_path, FAILURES_PATH)
+
+def index_db():
+    global _index
+    if _index is None:
+        ensure_cache_dir()
+        db = sqlite3.connect(str(INDEX_PATH), timeout=5, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(INDEX_SCHEMA)
+        _index = db
+    return _index
+
+def manifest():
+    """
+    key -> local path of every cached icon, loaded from the index in one query.
+
+    Long-lived processes (the daemon) reload it when another process has
+    written to the index, checked at most once per MANIFEST_CHECK_INTERVAL.
+    """
+    global _manifest, _manifest_version, _manifest_checked_at
+    now = time.monotonic()
+    if _manifest is not None and now - _manifest_checked_at < MANIFEST_CHECK_INTERVAL:
+        return _manifest
+    _manifest_checked_at = now
+    with timings.phase("icons"):
+        db = index_db()
+        version = db.execute("PRAGMA data_version").fetchone()[0]
+        if _manifest is None or version != _manifest_version:
+            prefix = str(CACHE_DIR) + os.sep
+            _manifest = {key: prefix + filename for key, filename in db.execute("SELECT key, filename FROM icons")}
+            _manifest_version = version
+    return _manifest
+
+def cached_icon_path(key):
+    """Local path of a cached icon, or None"""
+    try:
+        return manifest().get(key)
+    except sqlite3.Error:
+        return None
+
+def record_icons(icons):
+    """Mark icons (key -> (filename, size)) as used now"""
+    if not icons:
+        return
+    now = time.time()
+    db = index_db()
+    with db:
+        db.execute("BEGIN")
+        for key, (filename, size) in icons.items():
+            db.execute("DELETE FROM icons WHERE filename = ? AND key != ?", (filename, key))
+            db.execute(
+                "INSERT OR REPLACE INTO icons (key, filename, size, last_used) VALUES (?, ?, ?, ?)",
+                (key, filename, size, now)
+            )
+    # PRAGMA data_version does not change for this connection's own writes
+    if _manifest is not None:
+        for key, (filename, size) in icons.items():
+            _manifest[key] = str(CACHE_DIR / filename)
+
+def touch_icons(keys):
+    """Mark indexed icons as used now"""
+    if keys:
+        now = time.time()
+        index_db().executemany("UPDATE icons SET last_used = ? WHERE key = ?", [(now, key) for key in keys])
+
+def get_gc_state(key):
+    row = index_db().execute("SELECT value FROM gc_state WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else 0
+
+def set_gc_state(key, value):
+    index_db().execute("INSERT OR REPLACE INTO gc_state (key, value) VALUES (?, ?)", (key, value))
+
+def remove_icons(rows):
+    """Delete (key, filename) rows from the index and their files from the cache"""
+    db = index_db()
+    for key, filename in rows:
+        try:
+            (CACHE_DIR / filename).unlink()
+        except FileNotFoundError:
+            pass
+        db.execute("DELETE FROM icons WHERE key = ?", (key,))
+        if _manifest is not None:
+            _manifest.pop(key, None)
+    return len(rows)
+
+def is_icon_file(name):
+    if name.startswith(".") or "." not in name:
+        return False
+    stem, extension = name.rsplit(".", 1)
+    if stem.startswith("thumb_"):
+        return extension == "png"
+    return len(stem) == 32 and all(c in "0123456789abcdef" for c in stem)
+
+def reconcile_index(batch=GC_BATCH):
+    """
+    Bring the index in line with the cache directory: adopt icon files it does
+    not know (e.g. cached by older versions) and forget entries whose file is gone.
+    Returns True once the directory is fully accounted for.
+    """
+    db = index_db()
+    with os.scandir(CACHE_DIR) as entries:
+        names = {entry.name for entry in entries if is_icon_file(entry.name)}
+    indexed = dict(db.execute("SELECT filename, key FROM icons"))
+
+    for filename in set(indexed) - names:
+        db.execute("DELETE FROM icons WHERE key = ?", (indexed[filename],))
+
+    untracked = sorted(names - set(indexed))
+    for filename in untracked[:batch]:
+        try:
+            stat = (CACHE_DIR / filename).stat()
+        except FileNotFoundError:
+            continue
+        key = thumbnail_key(filename[len("thumb_"):-len(".png")]) if filename.startswith("thumb_") else f"file:{filename}"
+        db.execute(
+            "INSERT OR IGNORE INTO icons (key, filename, size, last_used) VALUES (?, ?, ?, ?)",
+            (key, filename, stat.st_size, stat.st_mtime)
+        )
+    return len(untracked) <= batch
+
+def remove_orphans(referenced_keys, batch=GC_BATCH):
+    """Remove icons not referenced by any bookmark. Returns True when none are left."""
+    rows = index_db().execute(
+        "SELECT key, filename FROM icons WHERE last_used < ?", (time.time() - ORPHAN_GRACE,)
+    ).fetchall()
+    orphans = [row for row in rows if row[0] not in referenced_keys]
+    remove_icons(orphans[:batch])
+    return len(orphans) <= batch
+
+def evict_over_budget(batch=GC_BATCH):
+    """Remove least recently used icons while the cache is over its size or entry budget"""
+    db = index_db()
+    total_size, count = db.execute("SELECT COALESCE(SUM(size), 0), COUNT(*) FROM icons").fetchone()
+    max_bytes = ICON_CACHE_MAX_MB * 1024 * 1024
+    evicted = []
+    for key, filename, size in db.execute("SELECT key, filename, size FROM icons ORDER BY last_used LIMIT ?", (batch,)):
+        if total_size <= max_bytes and count <= ICON_CACHE_MAX_ENTRIES:
+            break
+        evicted.append((key, filename))
+        total_size -= size
+        count -= 1
+    return remove_icons(evicted)
+
+def collect_garbage(referenced_keys=None):
+    """
+    One bounded step of icon cache maintenance, cheap enough to run after every prefetch.
+
+    Eviction only reads the index. The directory and orphan passes run once per
+    GC_FULL_INTERVAL and resume on the next call if they had more than GC_BATCH
+    files to handle. Orphans are only removed when referenced_keys (the icon
+    keys of every bookmark) is known.
+    """
+    ensure_cache_dir()
+    now = time.time()
+    if now - get_gc_state("last_reconcile") > GC_FULL_INTERVAL and reconcile_index():
+        set_gc_state("last_reconcile", now)
+    if referenced_keys is not None and now - get_gc_state("last_orphan_check") > GC_FULL_INTERVAL:
+        if remove_orphans(referenced_keys):
+            set_gc_state("last_orphan_check", now)
+    return evict_over_budget()
+
+def bookmark_icons(bookmarks):
+    """key -> (url, headers, cache path) for every icon of the bookmarks"""
+    jobs = {}
+    for bookmark in bookmarks:
+        content = bookmark.get("content", {})
+        content_type = content.get("type")
+        if content_type == "text" or content_type == "asset":
+            asset_id = content.get("assetId")
+            if asset_id:
+                jobs[thumbnail_key(asset_id)] = (f"{HOARDER_SERVER_ADDR}/api/assets/{asset_id}", HEADERS, thumbnail_cache_path(asset_id))
+        elif content.get("favicon"):
+            jobs[favicon_key(content["favicon"])] = (content["favicon"], {}, favicon_cache_path(content["favicon"]))
+    return jobs
+
+def spool_path(key):
+    return SPOOL_DIR / (hashlib.md5(key.encode()).hexdigest() + ".json")
+
+def spool_bookmarks(key, bookmarks):
+    """Hand the icon fields of a rendered list (by result cache key) to the prefetcher"""
+    icons = []
+    for bookmark in bookmarks:
+        content = bookmark.get("content", {})
+        icons.append({"content": {field: content[field] for field in ("type", "favicon", "assetId") if field in content}})
+
+    SPOOL_DIR.mkdir(parents=True, exist_ok=True)
+    path = spool_path(key)
+    partial_path = path.with_name(f".{path.name}.{os.getpid()}")
+    partial_path.write_text(json.dumps(icons))
+    os.replace(partial_path, path)
+
+def take_spooled_bookmarks(key, wait=SPOOL_WAIT):
+    """Claim the list spooled for a key, waiting briefly for it. Returns None if none came."""
+    path = spool_path(key)
+    give_up_at = time.monotonic() + wait
+    while True:
+        try:
+            bookmarks = json.loads(path.read_text())
+            path.unlink()
+            break
+        except FileNotFoundError:
+            if time.monotonic() >= give_up_at:
+                bookmarks = None
+                break
+            time.sleep(0.1)
+        except ValueError:
+            bookmarks = None
+            break
+
+    # lists spooled for queries nobody prefetched
+    now = time.time()
+    for stale in SPOOL_DIR.glob("*.json") if SPOOL_DIR.exists() else ():
+        try:
+            if now - stale.stat().st_mtime > SPOOL_MAX_AGE:
+                stale.unlink()
+        except OSError:
+            pass
+    return bookmarks
+
+def cached_size(cache_path):
+    try:
+        return cache_path.stat().st_size
+    except FileNotFoundError:
+        return 0
+
+class IconPrefetcher:
+    """
+    Download icons in parallel with per-host limits and an overall deadline.
+
+    Each host gets its own requests session (so connections are reused) and a
+    queue. A download is only handed to the pool while its host has fewer than
+    PER_HOST_CONCURRENCY running, so a slow or dead host never leaves workers
+    waiting on its limit while icons from other hosts queue behind them.
+    """
+
+    def __init__(self, deadline=PREFETCH_DEADLINE):
+        self.deadline = time.monotonic() + deadline
+        self.lock = threading.Lock()
+        self.sessions = {}
+
+    def host_session(self, host):
+        with self.lock:
+            if host not in self.sessions:
+                # imported here, as render.py loads this module in every script filter
+                lazy_imports.install()
+                import requests
+                from requests.adapters import HTTPAdapter
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=PER_HOST_CONCURRENCY)
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self.sessions[host] = session
+            return self.sessions[host]
+
+    def remaining(self):
+        return self.deadline - time.monotonic()
+
+    def download(self, url, headers, cache_path):
+        """True if the icon was cached, False if it failed, None if cut short by the deadline"""
+        session = self.host_session(urlparse(url).netloc)
+        import requests
+        remaining = self.remaining()
+        if remaining <= 0:
+            return None
+        try:
+            with session.get(url, headers=headers, timeout=min(DOWNLOAD_TIMEOUT, remaining), stream=True) as response:
+                response.raise_for_status()
+                chunks = []
+                for chunk in response.iter_content(16384):
+                    if self.remaining() <= 0:
+                        return None
+                    chunks.append(chunk)
+            # write atomically so readers never see a partial icon
+            partial_path = cache_path.with_name(f".{cache_path.name}.{os.getpid()}.{threading.get_ident()}")
+            partial_path.write_bytes(b"".join(chunks))
+            os.replace(partial_path, cache_path)
+            return True
+        except requests.exceptions.Timeout:
+            # only a full-length timeout says something about the host
+            return False if remaining >= DOWNLOAD_TIMEOUT else None
+        except requests.exceptions.RequestException as e:
+            print(f"Error downloading icon {url}: {e}", file=sys.stderr)
+            return False
+        except OSError as e:
+            print(f"Error caching icon {url}: {e}", file=sys.stderr)
+            return None
+
+    def run(self, jobs):
+        """Download the jobs; returns the number of icons cached before the deadline"""
+        if not jobs:
+            return 0
+        ensure_cache_dir()
+        queues = {}
+        for job in jobs:
+            queues.setdefault(urlparse(job[1]).netloc, deque()).append(job)
+        running = dict.fromkeys(queues, 0)
+        active, results = {}, {}
+        executor = ThreadPoolExecutor(max_workers=min(PREFETCH_WORKERS, len(jobs)))
+        try:
+            while True:
+                # start the next downloads of every host below its limit
+                for host, queue in queues.items():
+                    while queue and running[host] < PER_HOST_CONCURRENCY:
+                        key, url, headers, path = queue.popleft()
+                        active[executor.submit(self.download, url, headers, path)] = (key, host)
+                        running[host] += 1
+                if not active or self.remaining() <= 0:
+                    break
+                done, _ = wait(active, timeout=self.remaining(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, host = active.pop(future)
+                    running[host] -= 1
+                    results[key] = future.result()
+            paths = {key: path for key, url, headers, path in jobs}
+            record_icons({
+                key: (paths[key].name, cached_size(paths[key]))
+                for key, result in results.items() if result is True
+            })
+            record_results(
+                [key for key, result in results.items() if result is False],
+                [key for key, result in results.items() if result is True]
+            )
+            return sum(1 for result in results.values() if result)
+        finally:
+            # downloads still running stop themselves once the deadline has passed
+            executor.shutdown(wait=False, cancel_futures=True)
+
+def prefetch_icons(bookmarks, deadline=PREFETCH_DEADLINE):
+    """Cache the favicons and thumbnails of a bookmark list"""
+    jobs = []
+    used = []
+    adopted = {}
+    known = manifest()
+    for key, (url, headers, path) in bookmark_icons(bookmarks).items():
+        if key in known:
+            used.append(key)
+            continue
+        # a file cached before it was indexed under this key
+        size = cached_size(path)
+        if size > 0:
+            adopted[key] = (path.name, size)
+        elif not is_known_bad(key):
+            jobs.append((key, url, headers, path))
+    # icons shown in a result list count as recently used for LRU eviction
+    touch_icons(used)
+    record_icons(adopted)
+    return IconPrefetcher(deadline).run(jobs)
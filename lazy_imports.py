@@ -0,0 +1,63 @@
+import sys
+import types
+import importlib
+
+# Vendored packages that requests imports but the workflow rarely uses. Each is
+# loaded on first attribute access; the submodules listed are imported right
+# away and their names copied over, as requests reads e.g. __version__ at import.
+LAZY_MODULES = {
+    # charset detection, only used for non-JSON bodies without a charset
+    "charset_normalizer": ("version",),
+    # international domain names; its uts46data table is already imported on demand
+    "idna": ("package_data",),
+}
+
+class LazyModule(types.ModuleType):
+    """A module whose code runs the first time a missing attribute is looked up"""
+
+    def __getattr__(self, name):
+        loader = self.__dict__.pop("_lazy_loader", None)
+        if loader is None:
+            raise AttributeError(f"module {self.__name__!r} has no attribute {name!r}")
+        self.__class__ = types.ModuleType
+        self.__loader__ = self.__spec__.loader = loader
+        loader.exec_module(self)
+        return getattr(self, name)
+
+class LazyLoader:
+    def __init__(self, loader, eager):
+        self.loader = loader
+        self.eager = eager
+
+    def create_module(self, spec):
+        return LazyModule(spec.name)
+
+    def exec_module(self, module):
+        module.__dict__["_lazy_loader"] = self.loader
+        for submodule in self.eager:
+            values = vars(importlib.import_module(f"{module.__name__}.{submodule}"))
+            module.__dict__.update((name, value) for name, value in values.items() if name == "__version__" or not name.startswith("_"))
+
+class LazyFinder:
+    """Meta path finder that hands out LazyLoaders for the modules in LAZY_MODULES"""
+
+    def find_spec(self, fullname, path=None, target=None):
+        if fullname not in LAZY_MODULES:
+            return None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is None:
+                continue
+            # only plain source/bytecode modules can be created empty and run later
+            if spec.loader is None or spec.loader.create_module(spec) is not None:
+                return spec
+            spec.loader = LazyLoader(spec.loader, LAZY_MODULES[fullname])
+            return spec
+        return None
+
+def install():
+    """Defer the modules in LAZY_MODULES; call before the first import of requests"""
+    if not any(isinstance(finder, LazyFinder) for finder in sys.meta_path):
+        sys.meta_path.insert(0, LazyFinder())
@@ -1,7 +1,29 @@
-import requests
-import json
+import bundle
+bundle.install()
 import sys
-from hoarder import get_arg_and_icon, format_title_without_tags, HOARDER_SERVER_ADDR, HEADERS
+import daemon_client
+import timings
+import profiling
+
+# Hand the invocation to the hoarder daemon before importing the HTTP stack
+if __name__ == "__main__":
+    timings.start(__file__)
+    with timings.phase("daemon"):
+        daemon_client.forward_to_daemon(__file__)
+    profiling.start(__file__)
+
+import http_client
+import json
+import os
+import result_cache
+from hoarder import HEADERS, RESULT_CACHE_TTL
+from config import HOARDER_SERVER_ADDR
+from render import bookmark_record, icon_path, compact_bookmark, lean_bookmark
+
+timings.mark("imports")
+
+# Seconds before Alfred reruns the view to revalidate a bookmark passed by the list view
+REVALIDATE_RERUN = 0.1
 
 
 def generate_mods(bookmark):
@@ -9,27 +31,34 @@ def generate_mods(bookmark):
     Generate modifiers for Alfred Script Filter JSON output
     For general items excet for "Go Back", Note, Tags and title entry.
     """
+    record = bookmark_record(bookmark)
     mods = {
         "cmd": {
-            "arg": get_arg_and_icon(bookmark)[0],
+            "arg": record["arg"],
         },
         "option": {
-            "arg": f"{HOARDER_SERVER_ADDR}/dashboard/preview/{bookmark['id']}",
+            "arg": record["preview_url"],
         },
         "shift": {
-            "arg": f"[{format_title_without_tags(bookmark)}]({get_arg_and_icon(bookmark)[0]})",
+            "arg": record["markdown"],
         },
     }
     return mods
 
 def get_bookmark_details(bookmark_id):
-    """Fetch bookmark details from the Hoarder API"""
+    """Fetch bookmark details from the Hoarder API, or the copy hoarder.py prefetched"""
+    cached = result_cache.get_details(bookmark_id)
+    if cached is not None and cached[1] <= RESULT_CACHE_TTL:
+        return cached[0]
+
     url = f"{HOARDER_SERVER_ADDR}/api/v1/bookmarks/{bookmark_id}"
     try:
-        response = requests.get(url, headers=HEADERS)
+        response = http_client.get(url, headers=HEADERS)
         response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
+        bookmark = lean_bookmark(response.json())
+        result_cache.put_details(bookmark)
+        return bookmark
+    except http_client.RequestError as e:
         print(json.dumps({
             "items": [
                 {
@@ -42,42 +71,70 @@ def get_bookmark_details(bookmark_id):
         }))
         sys.exit(1)
 
-def format_alfred_output(bookmark):
+def passed_bookmark(bookmark_id):
+    """The copy of the bookmark handed over in the "bookmark" variable, if it is this one"""
+    try:
+        bookmark = json.loads(os.getenv("bookmark", ""))
+    except ValueError:
+        return None
+    return bookmark if isinstance(bookmark, dict) and bookmark.get("id") == bookmark_id else None
+
+def load_bookmark(bookmark_id):
+    """
+    Return the bookmark to show, plus extra top-level keys for the Alfred feedback.
+
+    A copy passed by the list view is shown at once and Alfred reruns the view
+    to fetch the current one. The fetched copy is passed on in turn, so the
+    tags view opened from here needs no request.
+    """
+    bookmark = passed_bookmark(bookmark_id)
+    checked = os.getenv("bookmark_checked", "")
+    if bookmark is not None and checked == f"fresh:{bookmark_id}":
+        return bookmark, {}
+    if bookmark is not None and checked != f"pending:{bookmark_id}":
+        return bookmark, {"rerun": REVALIDATE_RERUN, "variables": {"bookmark_checked": f"pending:{bookmark_id}"}}
+
+    bookmark = get_bookmark_details(bookmark_id)
+    return bookmark, {"variables": {"bookmark": compact_bookmark(bookmark), "bookmark_checked": f"fresh:{bookmark_id}"}}
+
+def format_alfred_output(bookmark, extra=None):
     """Format Alfred Script Filter JSON output"""
     items = []
+    record = bookmark_record(bookmark)
+    content = bookmark.get("content", {})
+    preview_url = record["preview_url"]
+    mods = generate_mods(bookmark)
 
     # Content title and URL (title and subtitle)
     items.append({
-        "title": format_title_without_tags(bookmark),
-        "subtitle": (bookmark.get("content", {}).get("url", "") or 
-                    bookmark.get("content", {}).get("text", "") or 
-                    bookmark.get("content", {}).get("fileName", "")),
-        "arg": bookmark.get("content", {}).get("url", "") or f"{HOARDER_SERVER_ADDR}/dashboard/preview/{bookmark.get('id', '')}",
+        "title": record["title"],
+        "subtitle": record["subtitle"],
+        "arg": content.get("url", "") or preview_url,
         "mods": {
             "ctrl": {
-                "arg": f"{HOARDER_SERVER_ADDR}/dashboard/preview/{bookmark.get('id', '')}",
+                "arg": preview_url,
                 ## THOUGHTS: I was thinking alfred textview to edit the title/text/note/summary, sticking with url for now
                 #"arg": bookmark.get("content", {}).get("text", "") if bookmark.get("content", {}).get("type") == "text" else f"{HOARDER_SERVER_ADDR}/dashboard/preview/{bookmark.get('id', '')}"
             },
             "option": {
-                "arg": f"{HOARDER_SERVER_ADDR}/dashboard/preview/{bookmark.get('id', '')}"
+                "arg": preview_url
             },
             "cmd": {
-                "arg": bookmark.get("content", {}).get("url", "") or f"{HOARDER_SERVER_ADDR}/dashboard/preview/{bookmark.get('id', '')}",
+                "arg": content.get("url", "") or preview_url,
             },
             "shift": {
-                "arg": f"[{format_title_without_tags(bookmark)}]({get_arg_and_icon(bookmark)[0]})"},
+                "arg": record["markdown"]},
             },
         "icon": {
-            "path": get_arg_and_icon(bookmark)[1]
+            "path": icon_path(record)
         },
-        "quicklookurl": bookmark.get("content", {}).get("url")
+        "quicklookurl": record["quicklookurl"]
     })
 
     tags = ", ".join(tag["name"] for tag in bookmark.get("tags", []))
 
     # Content description as title and tags as subtitle
-    content_description = bookmark["content"].get("description") or "No Description"
+    content_description = content.get("description") or "No Description"
     items.append({
         "subtitle": content_description,
         "title": tags if tags else "No Tags",
@@ -90,10 +147,10 @@ def format_alfred_output(bookmark):
                 "subtitle": "Copy tags to clipboard",
             }, 
             "option": {
-                "arg": f"{HOARDER_SERVER_ADDR}/dashboard/preview/{bookmark['id']}",
+                "arg": preview_url,
             },
             "shift": {
-                "arg": f"[{format_title_without_tags(bookmark)}]({get_arg_and_icon(bookmark)[0]})",
+                "arg": record["markdown"],
             },
         },
         "icon": {"path": "icons/label.png"}
@@ -109,17 +166,17 @@ def format_alfred_output(bookmark):
             #"arg": bookmark.get("id", "") + "?note=" + note if note else bookmark.get("id", "") + "?summary=" + summary,
             # Format arg as Markdown shown both note and summary if exists
             ## SAME AS ABOVE
-            "arg": f"{HOARDER_SERVER_ADDR}/dashboard/preview/{bookmark['id']}",
+            "arg": preview_url,
             "mods": {
                 "cmd": {
                     "arg": f"Note: {note}" if note else "Summary: {summary}" if summary else "",
                     "subtitle": "Copy note or summary to clipboard",
                 },
                 "option": {
-                    "arg": f"{HOARDER_SERVER_ADDR}/dashboard/preview/{bookmark['id']}",
+                    "arg": preview_url,
                 },
                 "shift": {
-                    "arg": f"[{format_title_without_tags(bookmark)}]({get_arg_and_icon(bookmark)[0]})",
+                    "arg": record["markdown"],
                 },
             },
             "icon": {"path": "icons/ledger.png"}
@@ -128,16 +185,17 @@ def format_alfred_output(bookmark):
     # Archived
     items.append({
         "title": "Archived" if bookmark.get("archived", False) else "Not Archived",
-        "arg": f"archive:{bookmark['id']}",
-        "mods": generate_mods(bookmark),
+        # the state to switch to, so actions.py needs no request to look it up
+        "arg": f"archive:{bookmark['id']}:{'false' if bookmark.get('archived', False) else 'true'}",
+        "mods": mods,
         "icon": {"path": "icons/white_check_mark.png"} if bookmark.get("archived", False) else {"path": "icons/radio_button.png"}
     })
 
     # Favorited
     items.append({
         "title": "Favorited" if bookmark.get("favourited", False) else "Not Favorited",
-        "arg": f"favorite:{bookmark['id']}",
-        "mods": generate_mods(bookmark),
+        "arg": f"favorite:{bookmark['id']}:{'false' if bookmark.get('favourited', False) else 'true'}",
+        "mods": mods,
         "icon": {"path": "icons/star.png"} if bookmark.get("favourited", False) else {"path": "icons/radio_button.png"}
     })
 
@@ -153,17 +211,17 @@ def format_alfred_output(bookmark):
 
     items.append({
         "title": "Screenshots: " + get_emoji_for_boolean(screenshots) + " Full Page Archive: " + get_emoji_for_boolean(full_page_archive),
-        "arg": f"{HOARDER_SERVER_ADDR}/dashboard/preview/{bookmark['id']}",
-        "mods": generate_mods(bookmark),
+        "arg": preview_url,
+        "mods": mods,
         "icon": {"path": "icons/package.png"}
     })
 
     # Delete action
     items.append({
-        "title": "Delete " + bookmark['content']['type'] + ": " + format_title_without_tags(bookmark),
-        "subtitle": bookmark['content']['url'] if bookmark['content']['type'] == "link" else format_title_without_tags(bookmark),
+        "title": "Delete " + content['type'] + ": " + record["title"],
+        "subtitle": content['url'] if content['type'] == "link" else record["title"],
         "arg": f"delete:{bookmark['id']}",
-        "mods": generate_mods(bookmark),
+        "mods": mods,
         "icon": {"path": "icons/wastebasket.png"}
     })
     # Go back
@@ -187,9 +245,9 @@ def format_alfred_output(bookmark):
         "icon": {"path": "icons/goback.png"}
     })
 
-    return json.dumps({"items": items}, indent=2)
+    return json.dumps(dict({"items": items}, **(extra or {})), indent=2)
 
-def show_bookmark_tags(bookmark):
+def show_bookmark_tags(bookmark, extra=None):
     """Format bookmark tags as Alfred Script Filter JSON output"""
     items = []
     
@@ -212,7 +270,7 @@ def show_bookmark_tags(bookmark):
             "icon": {"path": "icons/label.png"}
         })
     
-    return json.dumps({"items": items}, indent=2)
+    return json.dumps(dict({"items": items}, **(extra or {})), indent=2)
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -228,15 +286,16 @@ if __name__ == "__main__":
         sys.exit(1)
 
     bookmark_id = sys.argv[1]
-    bookmark = get_bookmark_details(bookmark_id)
+    bookmark, extra = load_bookmark(bookmark_id)
     
     # Check if --tags option is provided
     # Check if bookmark is empty
-    if bookmark_id == "":
-        output = json.dumps({"items": [{"title": "Go Back to Search Bookmarks", "icon": {"path": "icons/goback.png"}, "arg": ":action:back"}]})
-    elif len(sys.argv) > 2 and sys.argv[2] == "--tags":
-        output = show_bookmark_tags(bookmark)
-    else:
-        output = format_alfred_output(bookmark)
+    with timings.phase("render"):
+        if bookmark_id == "":
+            output = json.dumps({"items": [{"title": "Go Back to Search Bookmarks", "icon": {"path": "icons/goback.png"}, "arg": ":action:back"}]})
+        elif len(sys.argv) > 2 and sys.argv[2] == "--tags":
+            output = show_bookmark_tags(bookmark, extra)
+        else:
+            output = format_alfred_output(bookmark, extra)
     
     print(output)
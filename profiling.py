@@ -0,0 +1,91 @@
+import os
+import sys
+import time
+import daemon_client
+from config import CACHE_DIR, HOARDER_PROFILE, ensure_cache_dir
+
+# Profiles the next runs while it exists; it may list the modes, e.g. "cpu memory"
+PROFILE_MARKER_PATH = CACHE_DIR / "profile"
+PROFILES_DIR = CACHE_DIR / "profiles"
+# Captures kept (the oldest are removed), and allocation sites listed per memory capture
+PROFILE_MAX_CAPTURES = 20
+PROFILE_TOP_ALLOCATIONS = 25
+PROFILE_MODES = ("cpu", "memory")
+
+_capture = None
+
+def requested_modes():
+    """Profiling modes asked for by HOARDER_PROFILE or the marker file"""
+    text = HOARDER_PROFILE
+    if not text:
+        try:
+            # an empty marker file means cpu
+            text = PROFILE_MARKER_PATH.read_text() or "cpu"
+        except OSError:
+            return ()
+    return tuple(mode for mode in PROFILE_MODES if mode in text.replace(",", " ").split())
+
+def start(script_path):
+    """
+    Profile the rest of this script run, if requested.
+
+    Outside the daemon the capture is written when the process exits; the
+    daemon calls finish() after each script it runs.
+    """
+    global _capture
+    modes = requested_modes()
+    if not modes:
+        return
+    _capture = {"script": os.path.splitext(os.path.basename(script_path))[0], "modes": modes}
+    if "memory" in modes:
+        import tracemalloc
+        tracemalloc.start()
+    if "cpu" in modes:
+        import cProfile
+        _capture["profile"] = cProfile.Profile()
+        _capture["profile"].enable()
+    if not daemon_client.IN_DAEMON:
+        import atexit
+        atexit.register(finish)
+
+def write_memory(path):
+    import tracemalloc
+    snapshot = tracemalloc.take_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    lines = [f"current {current / 1024:.1f} KiB, peak {peak / 1024:.1f} KiB", ""]
+    lines += [str(stat) for stat in snapshot.statistics("lineno")[:PROFILE_TOP_ALLOCATIONS]]
+    path.write_text("\n".join(lines) + "\n")
+
+def prune():
+    """Keep the newest PROFILE_MAX_CAPTURES captures; names start with a timestamp"""
+    captures = {}
+    for path in PROFILES_DIR.iterdir():
+        captures.setdefault(path.name.split(".")[0], []).append(path)
+    for name in sorted(captures)[:-PROFILE_MAX_CAPTURES]:
+        for path in captures[name]:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+def finish():
+    """Write the capture: <name>.pstats for cpu, <name>.memory.txt for memory"""
+    global _capture
+    if _capture is None:
+        return
+    capture, _capture = _capture, None
+    profile = capture.get("profile")
+    if profile is not None:
+        profile.disable()
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(time.time() * 1000) % 1000:03d}-{capture['script']}-{os.getpid()}"
+    try:
+        ensure_cache_dir()
+        PROFILES_DIR.mkdir(exist_ok=True)
+        if profile is not None:
+            profile.dump_stats(str(PROFILES_DIR / f"{name}.pstats"))
+        if "memory" in capture["modes"]:
+            write_memory(PROFILES_DIR / f"{name}.memory.txt")
+        prune()
+    except OSError as e:
+        print(f"Error writing profile: {e}", file=sys.stderr)
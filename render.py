@@ -0,0 +1,143 @@
+import json
+import timings
+from config import HOARDER_SERVER_ADDR, TAGS_SHOWN_COUNT
+from icon_cache import favicon_key, thumbnail_key, cached_icon_path
+
+# Bookmark records kept per lean bookmark JSON; bounded for the long-lived daemon
+RECORD_MEMO_SIZE = 2000
+
+_records = {}
+
+# Bookmark fields read by the list, search, tag and detail views; page content is left out
+LEAN_FIELDS = ("id", "createdAt", "modifiedAt", "title", "archived", "favourited", "note", "summary")
+LEAN_CONTENT_FIELDS = ("type", "url", "title", "description", "text", "fileName", "assetType", "assetId", "favicon")
+
+def get_favicon_path(favicon_url):
+    """Return the local path of a favicon cached by hoarder-cache.py"""
+    if not favicon_url:
+        return "icon.png"
+
+    # looked up in the icon manifest, so no hashing or stat() per item
+    return cached_icon_path(favicon_key(favicon_url)) or "icon.png"
+
+def get_thumbnail_path(asset_id):
+    """Return the local path of an image asset thumbnail cached by hoarder-cache.py"""
+    if not asset_id:
+        return "icon.png"
+
+    return cached_icon_path(thumbnail_key(asset_id)) or "icon.png"
+
+def preview_url(bookmark_id):
+    return f"{HOARDER_SERVER_ADDR}/dashboard/preview/{bookmark_id}"
+
+def lean_bookmark(bookmark):
+    """A bookmark reduced to the fields the views render, without page content"""
+    content = bookmark.get("content", {})
+    lean = {field: bookmark[field] for field in LEAN_FIELDS if field in bookmark}
+    lean["content"] = {field: content[field] for field in LEAN_CONTENT_FIELDS if field in content}
+    lean["tags"] = [
+        {"id": tag.get("id"), "name": tag.get("name"), "attachedBy": tag.get("attachedBy")}
+        for tag in bookmark.get("tags", [])
+    ]
+    lean["assets"] = [{"id": asset.get("id"), "assetType": asset.get("assetType")} for asset in bookmark.get("assets", [])]
+    return lean
+
+def compact_bookmark(bookmark):
+    """Serialize a lean bookmark for an Alfred variable read by link-info.py"""
+    return json.dumps(lean_bookmark(bookmark), separators=(",", ":"))
+
+def bookmark_record(bookmark):
+    """
+    Derived display fields of a bookmark, computed in one pass over it.
+
+    Records are memoized by the lean bookmark's JSON, so any change to a
+    rendered field (even one that kept modifiedAt) makes a new record. The icon
+    is kept as a manifest key and resolved at render time, as it may be cached
+    later.
+    """
+    compact = compact_bookmark(bookmark)
+    record = _records.get(compact)
+    if record is not None:
+        return record
+
+    bookmark_id = bookmark.get("id", "")
+
+    content = bookmark.get("content", {})
+    content_type = content.get("type")
+
+    if content_type == "asset" and content.get("assetType") == "image":
+        title = content.get("fileName", "Untitled Image")
+    else:
+        title = content.get("title") or bookmark.get("title") or "Untitled"
+
+    title_with_tags = title
+    if TAGS_SHOWN_COUNT > 0:
+        tags = bookmark.get("tags", [])
+        if tags:
+            shown_tags = tags[:TAGS_SHOWN_COUNT]
+            title_with_tags = title + " " + ", ".join(f"#{tag.get('name', '')}" for tag in shown_tags if tag.get('name'))
+
+    if content_type == "text" or content_type == "asset":
+        arg = preview_url(bookmark_id)
+        asset_id = content.get("assetId") if content_type == "asset" else None
+        icon_key = thumbnail_key(asset_id) if asset_id else None
+    else:
+        arg = content.get("url", "")
+        icon_key = favicon_key(content["favicon"]) if content.get("favicon") else None
+
+    record = {
+        "id": bookmark_id,
+        "title": title,
+        "title_with_tags": title_with_tags,
+        "subtitle": content.get("url", "") or content.get("text", "") or content.get("fileName", ""),
+        "arg": arg,
+        "preview_url": preview_url(bookmark_id),
+        "markdown": f"[{title}]({arg})",
+        "icon_key": icon_key,
+        "quicklookurl": content.get("url"),
+        "compact": compact
+    }
+    if len(_records) >= RECORD_MEMO_SIZE:
+        _records.clear()
+    _records[compact] = record
+    return record
+
+def icon_path(record):
+    return (record["icon_key"] and cached_icon_path(record["icon_key"])) or "icon.png"
+
+def format_title_with_tags(bookmark):
+    """Format title with tags based on TAGS_SHOWN_COUNT"""
+    return bookmark_record(bookmark)["title_with_tags"]
+
+def format_title_without_tags(bookmark):
+    return bookmark_record(bookmark)["title"]
+
+def get_arg_and_icon(bookmark):
+    """Get appropriate arg and icon path based on content type"""
+    record = bookmark_record(bookmark)
+    return record["arg"], icon_path(record)
+
+def bookmark_item(bookmark, mod_subtitles=None):
+    """Alfred item for a bookmark in a list, search or tag view"""
+    record = bookmark_record(bookmark)
+    mods = {
+        # link-info.py renders the details from this copy and revalidates it
+        "ctrl": {"arg": record["id"], "variables": {"bookmark": record["compact"], "bookmark_checked": ""}},
+        "cmd": {"arg": record["arg"]},
+        "option": {"arg": record["preview_url"]},
+        "shift": {"arg": record["markdown"]}
+    }
+    for mod, subtitle in (mod_subtitles or {}).items():
+        mods[mod]["subtitle"] = subtitle
+    return {
+        "title": record["title_with_tags"],
+        "subtitle": record["subtitle"],
+        "arg": record["arg"],
+        "mods": mods,
+        "icon": {"path": icon_path(record)},
+        "quicklookurl": record["quicklookurl"]
+    }
+
+def bookmark_items(bookmarks, mod_subtitles=None):
+    with timings.phase("render"):
+        return [bookmark_item(bookmark, mod_subtitles) for bookmark in bookmarks]
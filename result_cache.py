@@ -0,0 +1,159 @@
+import json
+import time
+import sqlite3
+import threading
+from config import CACHE_DIR, RESULT_CACHE_MAX_AGE, RESULT_CACHE_MAX_ENTRIES, ensure_cache_dir
+
+DB_PATH = CACHE_DIR / "results.db"
+# A background refresh that has not finished after this many seconds is assumed dead
+REFRESH_CLAIM_TIMEOUT = 30
+# Touched when bookmarks change, so the daemon stops reusing output rendered before
+GENERATION_PATH = CACHE_DIR / "generation"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    bookmarks TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    refreshing_at REAL
+);
+CREATE INDEX IF NOT EXISTS results_accessed_at ON results (accessed_at);
+CREATE TABLE IF NOT EXISTS details (
+    id TEXT PRIMARY KEY,
+    bookmark TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tag_pages (
+    tag_id TEXT NOT NULL,
+    number INTEGER NOT NULL,
+    page TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (tag_id, number)
+);
+"""
+
+# one connection per thread, as background tasks run in threads inside the daemon
+_local = threading.local()
+
+def connect():
+    db = getattr(_local, "connection", None)
+    if db is None:
+        ensure_cache_dir()
+        db = sqlite3.connect(str(DB_PATH), timeout=5, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.executescript(SCHEMA)
+        _local.connection = db
+    return db
+
+def cache_key(kind, query=""):
+    """Normalize a query so that case and whitespace differences share an entry"""
+    return f"{kind}:{' '.join(query.lower().split())}"
+
+def get(key):
+    """Return (bookmarks, age in seconds) for a cached query, or None"""
+    db = connect()
+    now = time.time()
+    row = db.execute("SELECT bookmarks, fetched_at FROM results WHERE key = ?", (key,)).fetchone()
+    if row is None or now - row[1] > RESULT_CACHE_MAX_AGE:
+        return None
+    db.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+    return json.loads(row[0]), now - row[1]
+
+def put(key, bookmarks):
+    """Store a fresh result and evict expired and least recently used entries"""
+    db = connect()
+    now = time.time()
+    db.execute(
+        "INSERT OR REPLACE INTO results (key, bookmarks, fetched_at, accessed_at, refreshing_at) "
+        "VALUES (?, ?, ?, ?, NULL)",
+        (key, json.dumps(bookmarks), now, now)
+    )
+    db.execute("DELETE FROM results WHERE fetched_at < ?", (now - RESULT_CACHE_MAX_AGE,))
+    db.execute(
+        "DELETE FROM results WHERE key NOT IN "
+        "(SELECT key FROM results ORDER BY accessed_at DESC LIMIT ?)",
+        (RESULT_CACHE_MAX_ENTRIES,)
+    )
+    bump_generation()
+
+def claim_refresh(key):
+    """Mark a background refresh as running. Returns False if one already is."""
+    now = time.time()
+    cursor = connect().execute(
+        "UPDATE results SET refreshing_at = ? WHERE key = ? "
+        "AND (refreshing_at IS NULL OR refreshing_at < ?)",
+        (now, key, now - REFRESH_CLAIM_TIMEOUT)
+    )
+    return cursor.rowcount > 0
+
+def release_refresh(key):
+    connect().execute("UPDATE results SET refreshing_at = NULL WHERE key = ?", (key,))
+
+def get_details(bookmark_id):
+    """Return (bookmark, age in seconds) of a cached /api/v1/bookmarks/{id} response, or None"""
+    row = connect().execute("SELECT bookmark, fetched_at FROM details WHERE id = ?", (bookmark_id,)).fetchone()
+    if row is None or time.time() - row[1] > RESULT_CACHE_MAX_AGE:
+        return None
+    return json.loads(row[0]), time.time() - row[1]
+
+def put_details(bookmark):
+    db = connect()
+    now = time.time()
+    db.execute(
+        "INSERT OR REPLACE INTO details (id, bookmark, fetched_at) VALUES (?, ?, ?)",
+        (bookmark.get("id"), json.dumps(bookmark), now)
+    )
+    db.execute(
+        "DELETE FROM details WHERE fetched_at < ? OR id NOT IN "
+        "(SELECT id FROM details ORDER BY fetched_at DESC LIMIT ?)",
+        (now - RESULT_CACHE_MAX_AGE, RESULT_CACHE_MAX_ENTRIES)
+    )
+
+def get_tag_page(tag_id, number):
+    """Return (page, age in seconds) of a cached page of a tag's bookmarks, or None"""
+    row = connect().execute(
+        "SELECT page, fetched_at FROM tag_pages WHERE tag_id = ? AND number = ?", (tag_id, number)
+    ).fetchone()
+    if row is None or time.time() - row[1] > RESULT_CACHE_MAX_AGE:
+        return None
+    return json.loads(row[0]), time.time() - row[1]
+
+def put_tag_page(tag_id, number, page):
+    """
+    Store a page of a tag's bookmarks. Kept apart from the results, so paging
+    through a large tag does not evict cached searches.
+    """
+    db = connect()
+    now = time.time()
+    # the cursors of the later pages belong to the replaced page
+    db.execute("DELETE FROM tag_pages WHERE tag_id = ? AND number >= ?", (tag_id, number))
+    db.execute(
+        "INSERT INTO tag_pages (tag_id, number, page, fetched_at) VALUES (?, ?, ?, ?)",
+        (tag_id, number, json.dumps(page), now)
+    )
+    db.execute(
+        "DELETE FROM tag_pages WHERE fetched_at < ? OR rowid NOT IN "
+        "(SELECT rowid FROM tag_pages ORDER BY fetched_at DESC LIMIT ?)",
+        (now - RESULT_CACHE_MAX_AGE, RESULT_CACHE_MAX_ENTRIES)
+    )
+
+def bump_generation():
+    """Mark every list rendered so far as outdated"""
+    ensure_cache_dir()
+    GENERATION_PATH.touch()
+
+def generation():
+    """A stamp that changes with each bump_generation(), in any process"""
+    try:
+        return GENERATION_PATH.stat().st_mtime_ns
+    except FileNotFoundError:
+        return 0
+
+def clear():
+    """Drop every cached result, e.g. after a bookmark was changed"""
+    db = connect()
+    db.execute("DELETE FROM results")
+    db.execute("DELETE FROM details")
+    db.execute("DELETE FROM tag_pages")
+    bump_generation()
@@ -0,0 +1,89 @@
+import re
+import html
+import sqlite3
+
+# Columns of the full text index, and their BM25 weights (id is not searchable).
+# Each row's rowid is the rowid of the bookmark in the bookmarks table, so rows
+# are replaced and removed by key instead of scanning the unindexed id column.
+COLUMNS = ("id", "title", "url", "description", "note", "summary", "content", "tags")
+WEIGHTS = (0.0, 10.0, 4.0, 3.0, 5.0, 3.0, 1.0, 6.0)
+
+SCHEMA = f"""
+CREATE VIRTUAL TABLE IF NOT EXISTS bookmarks_fts USING fts5(
+    id UNINDEXED, {", ".join(COLUMNS[1:])},
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+TAG_PATTERN = re.compile(r"<(script|style)\b.*?</\1>|<[^>]+>", re.IGNORECASE | re.DOTALL)
+TERM_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+def create(db):
+    """Create the FTS5 table. Returns False if this SQLite build lacks FTS5."""
+    try:
+        db.execute(SCHEMA)
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+def html_to_text(html_content):
+    return html.unescape(TAG_PATTERN.sub(" ", html_content or ""))
+
+def document(bookmark):
+    """Searchable fields of a bookmark, in COLUMNS order"""
+    content = bookmark.get("content", {})
+    return (
+        bookmark.get("id"),
+        content.get("title") or bookmark.get("title") or content.get("fileName") or "",
+        content.get("url") or "",
+        content.get("description") or "",
+        bookmark.get("note") or "",
+        bookmark.get("summary") or "",
+        html_to_text(content.get("htmlContent")) + " " + (content.get("text") or ""),
+        " ".join(tag.get("name", "") for tag in bookmark.get("tags", []))
+    )
+
+def index_bookmark(db, rowid, bookmark):
+    db.execute("DELETE FROM bookmarks_fts WHERE rowid = ?", (rowid,))
+    db.execute(
+        f"INSERT INTO bookmarks_fts (rowid, {', '.join(COLUMNS)}) VALUES (?, {', '.join('?' for _ in COLUMNS)})",
+        (rowid,) + document(bookmark)
+    )
+
+def remove(db, rowids):
+    db.executemany("DELETE FROM bookmarks_fts WHERE rowid = ?", [(rowid,) for rowid in rowids])
+
+def rebuild(db, rows):
+    """Index (rowid, bookmark) pairs from scratch"""
+    db.execute("DELETE FROM bookmarks_fts")
+    for rowid, bookmark in rows:
+        index_bookmark(db, rowid, bookmark)
+
+def rekey(db):
+    """Renumber rows indexed before rowids followed the bookmarks table, keeping their text"""
+    db.execute(
+        f"CREATE TEMP TABLE fts_rekey AS SELECT bookmarks.rowid AS bookmark_rowid, {', '.join('bookmarks_fts.' + c for c in COLUMNS)} "
+        f"FROM bookmarks_fts JOIN bookmarks ON bookmarks.id = bookmarks_fts.id"
+    )
+    db.execute("DELETE FROM bookmarks_fts")
+    db.execute(
+        f"INSERT INTO bookmarks_fts (rowid, {', '.join(COLUMNS)}) SELECT bookmark_rowid, {', '.join(COLUMNS)} FROM fts_rekey"
+    )
+    db.execute("DROP TABLE fts_rekey")
+
+def match_expression(query):
+    """Turn free text into an FTS5 query: every term must match, as a prefix"""
+    terms = TERM_PATTERN.findall(query)
+    return " AND ".join(f'"{term}"*' for term in terms)
+
+def search(db, query, limit=20):
+    """Return bookmark ids matching the query, best BM25 score first"""
+    expression = match_expression(query)
+    if not expression:
+        return []
+    rows = db.execute(
+        f"SELECT id FROM bookmarks_fts WHERE bookmarks_fts MATCH ? "
+        f"ORDER BY bm25(bookmarks_fts, {', '.join(str(w) for w in WEIGHTS)}) LIMIT ?",
+        (expression, limit)
+    )
+    return [row[0] for row in rows]
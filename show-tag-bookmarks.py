@@ -1,38 +1,150 @@
-import requests
-import json
+import bundle
+bundle.install()
 import sys
+import daemon_client
+import timings
+import profiling
+
+# Hand the invocation to the hoarder daemon before importing the HTTP stack
+if __name__ == "__main__":
+    timings.start(__file__)
+    with timings.phase("daemon"):
+        daemon_client.forward_to_daemon(__file__)
+    profiling.start(__file__)
+
+import http_client
+import json
+import os
+import bookmark_store
+import result_cache
 from hoarder import (
-    HOARDER_SERVER_ADDR,
     HEADERS,
     ensure_cache_dir,
-    get_favicon_path,
-    get_thumbnail_path,
-    format_title_with_tags,
-    format_title_without_tags,
-    get_arg_and_icon
+    use_local_mirror
 )
+from config import HOARDER_SERVER_ADDR, TAG_INDEX_TTL, TAG_MAX_PAGES, RESULT_CACHE_TTL
+from render import bookmark_items, lean_bookmark
+
+timings.mark("imports")
 
+# Bookmarks per page of a tag view
+TAG_PAGE_SIZE = 50
 
-def get_tag_id_by_name(tag_name):
+def get_tag_id_by_name(tag_name, reload=False):
     """Get tag ID by tag name (case insensitive)"""
+    if not reload:
+        # the index show-tags.py keeps, while it is fresh
+        tag_id = bookmark_store.tag_id_by_name(tag_name, max_age=TAG_INDEX_TTL)
+        if tag_id:
+            return tag_id
+
+    # unknown or stale: the tag may be new or renamed, so reload the tag list
     try:
-        tags_url = f"{HOARDER_SERVER_ADDR}/api/v1/tags"
-        response = requests.get(tags_url, headers=HEADERS)
-        response.raise_for_status()
-        data = response.json()
-        
-        tags = data.get("tags", [])
-        for tag in tags:
-            if tag.get("name", "").lower() == tag_name.lower():
-                return tag.get("id")
-        
-        return None
-    except requests.exceptions.RequestException:
+        bookmark_store.sync_tags()
+    except http_client.RequestError:
         return None
+    return bookmark_store.tag_id_by_name(tag_name)
+
+def fetch_tag_page(tag_id, cursor=None):
+    """Fetch one page of a tag's bookmarks, returning the bookmarks and the next cursor"""
+    api_url = f"{HOARDER_SERVER_ADDR}/api/v1/tags/{tag_id}/bookmarks"
+    params = {
+        'limit': TAG_PAGE_SIZE,
+        'includeContent': 'false',
+        'sortOrder': 'desc'
+    }
+    if cursor:
+        params['cursor'] = cursor
+
+    # later pages are kept in the result cache; their cursors change with the first page
+    response = http_client.get(api_url, revalidate=not cursor, headers=HEADERS, params=params)
+    response.raise_for_status()
+    data = response.json()
+    bookmarks = [lean_bookmark(bookmark) for bookmark in data.get("bookmarks", [])]
+    return {"bookmarks": bookmarks, "nextCursor": data.get("nextCursor")}
+
+def load_tag_bookmarks(tag_id):
+    """
+    Return the bookmarks of a tag, the number of pages loaded and whether the
+    tag has more.
+
+    The first page is shown; each "Load more" adds one. Pages and their cursors
+    are kept in the result cache, so loading more only fetches the new page.
+    """
+    tag_key = f"tag:{tag_id}"
+    # set by the Load more item; variables persist for the whole Alfred session, so check the tag
+    pages_shown = int(os.getenv("tag_pages", "0")) if os.getenv("tag_pages_key") == tag_key else 0
+    wanted = min(pages_shown + 1, TAG_MAX_PAGES)
+
+    bookmarks, seen = [], set()
+    cursor, fetched = None, False
+    for number in range(wanted):
+        cached = None if fetched else result_cache.get_tag_page(tag_id, number)
+        # pages already shown stay as they were, the others only while fresh
+        if cached is not None and (number < pages_shown or cached[1] <= RESULT_CACHE_TTL):
+            page = cached[0]
+        else:
+            # refetching a page invalidates the cursors of the cached pages after it
+            page = fetch_tag_page(tag_id, cursor)
+            result_cache.put_tag_page(tag_id, number, page)
+            fetched = True
+
+        bookmarks.extend(b for b in page["bookmarks"] if b.get("id") not in seen)
+        seen.update(b.get("id") for b in page["bookmarks"])
+        cursor = page["nextCursor"]
+        if not cursor:
+            return bookmarks, number + 1, False
+    return bookmarks, wanted, True
+
+def format_tag_bookmarks(bookmarks):
+    """Format bookmarks of a tag as Alfred items, led by a Go Back item"""
+    # Format bookmarks for Alfred feedback
+    items = []
+    
+    # Add "Go Back" item at the beginning
+    items.append({
+        "title": "Go Back to Tags",
+        "subtitle": "Return to tag list",
+        "icon": {
+            "path": "icons/goback.png"
+        },
+        "arg": ":action:back"
+    })
+    
+    # Add bookmark items
+    items.extend(bookmark_items(bookmarks, mod_subtitles={
+        "ctrl": "View bookmark details",
+        "cmd": "Copy URL to clipboard",
+        "option": "Open in Hoarder",
+        "shift": "Copy as Markdown link"
+    }))
+    
+    # If no bookmarks found, show only Go Back and message
+    if not bookmarks:
+        items = [{
+            "title": "Go Back to Tags",
+            "subtitle": "Return to tag list",
+            "icon": {
+                "path": "icons/goback.png"
+            },
+            "arg": ":action:back"
+        }, {
+            "title": "No bookmarks found",
+            "subtitle": "This tag has no associated bookmarks",
+            "icon": {
+                "path": "icon.png"
+            }
+        }]
+
+    return items
 
 def fetch_bookmarks_by_tag(tag_name):
     try:
         ensure_cache_dir()
+
+        if use_local_mirror():
+            print(json.dumps({"items": format_tag_bookmarks(bookmark_store.bookmarks_by_tag_name(tag_name, TAG_PAGE_SIZE * TAG_MAX_PAGES))}))
+            return
         
         # First get the tag ID from the tag name
         tag_id = get_tag_id_by_name(tag_name)
@@ -59,89 +171,46 @@ def fetch_bookmarks_by_tag(tag_name):
             }))
             return
         
-        # Construct the API URL for fetching bookmarks by tag
-        api_url = f"{HOARDER_SERVER_ADDR}/api/v1/tags/{tag_id}/bookmarks"
-        
-        # Add pagination params
-        params = {
-            'limit': 50,
-            'includeContent': 'true',
-            'sortOrder': 'desc'
-        }
-        
-        response = requests.get(api_url, headers=HEADERS, params=params)
-        response.raise_for_status()
-        data = response.json()
-        
-        bookmarks = data.get("bookmarks", [])
-        
-        # Format bookmarks for Alfred feedback
-        items = []
-        
-        # Add "Go Back" item at the beginning
-        items.append({
-            "title": "Go Back to Tags",
-            "subtitle": "Return to tag list",
-            "icon": {
-                "path": "icons/goback.png"
-            },
-            "arg": ":action:back"
-        })
-        
-        # Add bookmark items
-        items.extend([
-            {
-                "title": format_title_with_tags(bookmark),
-                    "subtitle": (bookmark.get("content", {}).get("url", "") or 
-                               bookmark.get("content", {}).get("text", "") or 
-                               bookmark.get("content", {}).get("fileName", "")),
-                    "arg": get_arg_and_icon(bookmark)[0],
-                    "mods": {
-                        "ctrl": {
-                            "arg": bookmark.get("id", ""),
-                            "subtitle": "View bookmark details"
-                        },
-                        "cmd": {
-                            "arg": get_arg_and_icon(bookmark)[0],
-                            "subtitle": "Copy URL to clipboard"
-                        },
-                        "option": {
-                            "arg": f"{HOARDER_SERVER_ADDR}/dashboard/preview/{bookmark.get('id', '')}",
-                            "subtitle": "Open in Hoarder"
-                        },
-                        "shift": {
-                            "arg": f"[{format_title_without_tags(bookmark)}]({get_arg_and_icon(bookmark)[0]})",
-                            "subtitle": "Copy as Markdown link"
-                        }
-                    },
-                    "icon": {
-                        "path": get_arg_and_icon(bookmark)[1]
-                    },
-                    "quicklookurl": bookmark.get("content", {}).get("url")
-                } for bookmark in bookmarks
-            ])
-        
-        # If no bookmarks found, show only Go Back and message
-        if not bookmarks:
-            items = [{
-                "title": "Go Back to Tags",
-                "subtitle": "Return to tag list",
+        try:
+            bookmarks, pages, more = load_tag_bookmarks(tag_id)
+        except http_client.HTTPError as e:
+            # the indexed ID is gone (tag deleted or recreated); look it up again once
+            if e.response is None or e.response.status_code != 404:
+                raise
+            new_tag_id = get_tag_id_by_name(tag_name, reload=True)
+            if not new_tag_id or new_tag_id == tag_id:
+                raise
+            tag_id = new_tag_id
+            bookmarks, pages, more = load_tag_bookmarks(tag_id)
+
+        alfred_feedback = {"items": format_tag_bookmarks(bookmarks)}
+        if more and pages < TAG_MAX_PAGES:
+            alfred_feedback["items"].append({
+                "title": "Load more",
+                "subtitle": f"Show the next {TAG_PAGE_SIZE} bookmarks of this tag",
+                "arg": ":action:more",
                 "icon": {
-                    "path": "icons/goback.png"
+                    "path": "icon.png"
                 },
-                "arg": ":action:back"
-            }, {
-                "title": "No bookmarks found",
-                "subtitle": "This tag has no associated bookmarks",
+                # read back when the view is reopened with the next page
+                "variables": {
+                    "tag_name": tag_name,
+                    "tag_pages_key": f"tag:{tag_id}",
+                    "tag_pages": str(pages)
+                }
+            })
+        elif more:
+            alfred_feedback["items"].append({
+                "title": "More bookmarks not shown",
+                "subtitle": f"Only the first {len(bookmarks)} bookmarks of this tag are listed",
+                "valid": False,
                 "icon": {
                     "path": "icon.png"
                 }
-            }]
-        
-        alfred_feedback = {"items": items}
+            })
         print(json.dumps(alfred_feedback))
 
-    except requests.exceptions.RequestException as e:
+    except http_client.RequestError as e:
         print(json.dumps({
             "items": [
                 {
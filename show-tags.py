@@ -1,63 +1,93 @@
-import requests
-import json
+import bundle
+bundle.install()
 import sys
-from hoarder import HOARDER_SERVER_ADDR, HEADERS
+import daemon_client
+import timings
+import profiling
+
+# Hand the invocation to the hoarder daemon before importing the HTTP stack
+if __name__ == "__main__":
+    timings.start(__file__)
+    with timings.phase("daemon"):
+        daemon_client.forward_to_daemon(__file__)
+    profiling.start(__file__)
 
-HOARDER_TAGS_API_URL = f"{HOARDER_SERVER_ADDR}/api/v1/tags"
+import http_client
+import json
+import sqlite3
+import bookmark_store
+from hoarder import HEADERS, use_local_mirror
+from config import HOARDER_TAGS_API_URL
+
+timings.mark("imports")
+
+def store_tags(tags):
+    """Keep the tag name -> ID index used by show-tag-bookmarks.py current"""
+    try:
+        bookmark_store.replace_tags(tags)
+    except sqlite3.Error as e:
+        print(f"Error storing tags: {e}", file=sys.stderr)
 
 def fetch_tags():
+    fetched = None
     try:
-        response = requests.get(HOARDER_TAGS_API_URL, headers=HEADERS)
-        response.raise_for_status()
-        data = response.json()
-        
-        tags = data.get("tags", [])
+        if use_local_mirror():
+            tags = bookmark_store.list_tags()
+        else:
+            response = http_client.get(HOARDER_TAGS_API_URL, headers=HEADERS)
+            response.raise_for_status()
+            data = response.json()
+
+            tags = data.get("tags", [])
+            fetched = tags
         
         # Sort tags by number of bookmarks (descending)
         tags.sort(key=lambda x: x.get("numBookmarks", 0), reverse=True)
         
         # Format tags for Alfred feedback
         items = []
-        for tag in tags:
-            # Determine who added the tag based on numBookmarksByAttachedType
-            attached_by_type = tag.get('numBookmarksByAttachedType', {})
-            ai_count = attached_by_type.get('ai', 0)
-            human_count = attached_by_type.get('human', 0)
+        with timings.phase("render"):
+            for tag in tags:
+                # Determine who added the tag based on numBookmarksByAttachedType
+                attached_by_type = tag.get('numBookmarksByAttachedType', {})
+                ai_count = attached_by_type.get('ai', 0)
+                human_count = attached_by_type.get('human', 0)
             
-            # Determine primary source and format subtitle
-            if ai_count > 0 and human_count > 0:
-                source_indicator = "🤖👤"
-                attached_by = f"ai ({ai_count}) & human ({human_count})"
-            elif ai_count > 0:
-                source_indicator = "🤖"
-                attached_by = "ai"
-            elif human_count > 0:
-                source_indicator = "👤"
-                attached_by = "human"
-            else:
-                source_indicator = "❓"
-                attached_by = "unknown"
+                # Determine primary source and format subtitle
+                if ai_count > 0 and human_count > 0:
+                    source_indicator = "🤖👤"
+                    attached_by = f"ai ({ai_count}) & human ({human_count})"
+                elif ai_count > 0:
+                    source_indicator = "🤖"
+                    attached_by = "ai"
+                elif human_count > 0:
+                    source_indicator = "👤"
+                    attached_by = "human"
+                else:
+                    source_indicator = "❓"
+                    attached_by = "unknown"
             
-            items.append({
-                "title": f"#{tag.get('name', 'Unnamed Tag')}",
-                "subtitle": f"{source_indicator} • {tag.get('numBookmarks', 0)} bookmark{'s' if tag.get('numBookmarks', 0) != 1 else ''} • Added by: {attached_by}",
-                "arg": tag.get("name", ""),
-                "icon": {
-                    "path": "icons/label.png"
-                },
-                "variables": {
-                    "tag_id": tag.get("id", ""),
-                    "tag_name": tag.get("name", "")
-                }
-            })
+                items.append({
+                    "title": f"#{tag.get('name', 'Unnamed Tag')}",
+                    "subtitle": f"{source_indicator} • {tag.get('numBookmarks', 0)} bookmark{'s' if tag.get('numBookmarks', 0) != 1 else ''} • Added by: {attached_by}",
+                    "arg": tag.get("name", ""),
+                    "icon": {
+                        "path": "icons/label.png"
+                    },
+                    "variables": {
+                        "tag_id": tag.get("id", ""),
+                        "tag_name": tag.get("name", "")
+                    }
+                })
         
         alfred_feedback = {
             "items": items
         }
         
         print(json.dumps(alfred_feedback))
+        sys.stdout.flush()
 
-    except requests.exceptions.RequestException as e:
+    except http_client.RequestError as e:
         print(json.dumps({
             "items": [
                 {
@@ -71,5 +101,9 @@ def fetch_tags():
         }))
         sys.exit(1)
 
+    # after the tags are shown, so a busy mirror cannot hold them up
+    if fetched is not None:
+        store_tags(fetched)
+
 if __name__ == "__main__":
     fetch_tags()
\ No newline at end of file
@@ -0,0 +1,123 @@
+import os
+import sys
+import json
+import time
+import threading
+import daemon_client
+from config import CACHE_DIR, HOARDER_TRACE, ensure_cache_dir
+
+# One JSON line per traced invocation; rotated to trace.log.1 ... when it grows too big
+TRACE_LOG_PATH = CACHE_DIR / "trace.log"
+TRACE_LOG_MAX_BYTES = 1024 * 1024
+TRACE_LOG_BACKUPS = 3
+
+_trace = None
+_stack = []
+
+class Phase:
+    """Adds the time spent inside it to a phase, minus the time of phases nested in it"""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if tracing():
+            _stack.append([self.name, time.monotonic(), 0.0])
+        return self
+
+    def __exit__(self, *exc_info):
+        if tracing() and _stack and _stack[-1][0] == self.name:
+            name, started, nested = _stack.pop()
+            elapsed = time.monotonic() - started
+            add(name, elapsed - nested)
+            if _stack:
+                _stack[-1][2] += elapsed
+            else:
+                _trace["since_mark"] += elapsed
+        return False
+
+def tracing():
+    """Whether the current thread is running a traced invocation"""
+    return _trace is not None and _trace["thread"] == threading.get_ident()
+
+def start(script_path):
+    """
+    Start tracing an invocation of a script, if HOARDER_TRACE is set.
+
+    Outside the daemon the trace is written when the process exits; the daemon
+    calls finish() after each script it runs.
+    """
+    global _trace
+    if not HOARDER_TRACE:
+        return
+    in_daemon = daemon_client.IN_DAEMON
+    _trace = {
+        "script": os.path.basename(script_path),
+        "started": time.monotonic(),
+        "last_mark": time.monotonic(),
+        "since_mark": 0.0,
+        "thread": threading.get_ident(),
+        "daemon": in_daemon,
+        "phases": {},
+    }
+    _stack.clear()
+    if not in_daemon:
+        # CPU time the interpreter spent before the script's first line
+        add("startup", time.process_time())
+        import atexit
+        atexit.register(finish)
+
+def add(name, seconds):
+    if tracing():
+        _trace["phases"][name] = _trace["phases"].get(name, 0.0) + seconds
+
+def phase(name):
+    return Phase(name)
+
+def mark(name):
+    """Record the time since the previous mark (or the start), less the phases in between, e.g. imports"""
+    if tracing():
+        now = time.monotonic()
+        add(name, now - _trace["last_mark"] - _trace["since_mark"])
+        _trace["last_mark"], _trace["since_mark"] = now, 0.0
+
+def elapsed(name):
+    """Record the time since the start, e.g. when the output has been sent"""
+    if tracing():
+        add(name, time.monotonic() - _trace["started"])
+
+def rotate():
+    for number in range(TRACE_LOG_BACKUPS - 1, 0, -1):
+        source = TRACE_LOG_PATH.with_name(f"{TRACE_LOG_PATH.name}.{number}")
+        if source.exists():
+            os.replace(source, TRACE_LOG_PATH.with_name(f"{TRACE_LOG_PATH.name}.{number + 1}"))
+    try:
+        os.replace(TRACE_LOG_PATH, TRACE_LOG_PATH.with_name(f"{TRACE_LOG_PATH.name}.1"))
+    except FileNotFoundError:
+        pass  # rotated by a concurrent invocation
+
+def finish():
+    """Append the invocation's phases (milliseconds) to the trace log"""
+    global _trace
+    if not tracing():
+        return
+    elapsed("total")
+    record = {
+        "script": _trace["script"],
+        "at": round(time.time(), 3),
+        "daemon": _trace["daemon"],
+        "phases": {name: round(seconds * 1000, 3) for name, seconds in _trace["phases"].items()},
+    }
+    _trace = None
+    try:
+        ensure_cache_dir()
+        if TRACE_LOG_PATH.exists() and TRACE_LOG_PATH.stat().st_size > TRACE_LOG_MAX_BYTES:
+            rotate()
+        # a single O_APPEND write, so lines from concurrent invocations do not interleave
+        fd = os.open(TRACE_LOG_PATH, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+        try:
+            os.write(fd, (json.dumps(record) + "\n").encode())
+        finally:
+            os.close(fd)
+    except OSError as e:
+        print(f"Error writing trace: {e}", file=sys.stderr)